@@ -35,18 +35,44 @@ TODO:
 
 
 from utils import DriverInterface
+from modpack import RampMonitor
+import threading
 import pyvisa as visa
 from time import sleep
 import numpy as np
 
 
 class Driver(DriverInterface):
+    """ AMI 430 magnet controller of the Bluefors fridge
+
+        The ramp state (STATE?) and the field are read in one exchange.
+        A ramp is done when the controller holds at the target, ramp_done is
+        then True and the placeholder points of the ramp stop with 'done'.
+        Every point records the field read with the state, a RampMonitor
+        follows the readings for the rate and the ETA of the ramp.
+    """
     METHOD = ['Magnetic Field']
+    # the ramp points are -999 placeholders
+    PLACEHOLDER_SWEEP = True
+    # STATE? answers
+    STATES = {1: 'RAMPING', 2: 'HOLDING', 3: 'PAUSED', 4: 'MANUAL UP', 5: 'MANUAL DOWN',
+              6: 'ZEROING', 7: 'QUENCH', 8: 'AT ZERO', 9: 'HEATING SWITCH', 10: 'COOLING SWITCH'}
+    HOLDING = 2
+    # the field is at the target within this band (T)
+    FIELD_TOLERANCE = 1e-4
 
     def __init__(self, visa_address):
+        # e.g. TCPIP0::192.168.50.66::7180::SOCKET
         rm = visa.ResourceManager()
-        self.magnet = rm.open_resource('TCPIP0::192.168.50.66::7180::SOCKET')
+        self.magnet = rm.open_resource(visa_address)
         self.magnet.read_termination = '\r\n'
+        self.lock = threading.Lock()
+        # True when the controller holds at the target of the last ramp
+        self.ramp_done = True
+        self.monitor = None
+        self.state = None
+        # speed of the present sweep (T/s), the first guess of the ramp rate
+        self.ramp_rate = None
 
         # remove hello word
         for i in range(2):
@@ -65,25 +91,50 @@ class Driver(DriverInterface):
     def performClose(self):
         """Perform the close instrument connection operation"""
         command = 'PAUSE'
-        self.magnet.write(command)
+        with self.lock:
+            self.magnet.write(command)
         sleep(0.1)
         self.magnet.close()
 
+    def queryStateField(self):
+        """ return (state, field) read in one exchange """
+        with self.lock:
+            self.magnet.write('STATE?;FIELD:MAGnet?')
+            state = int(self.magnet.read())
+            field = float(self.magnet.read())
+        self.state = state
+        return state, field
+
+    def followRamp(self, state, field):
+        """ give a reading to the monitor, return True when the controller holds at the target """
+        self.monitor.update(field)
+        done = state == self.HOLDING and self.monitor.done
+        if done:
+            self.ramp_done = True
+        self.reportStatus(f'{self.STATES.get(state, state)}  {self.monitor.message()}')
+        return done
+
     def performSetValue(self, option, value, sweepRate=0.0):
         if option == 'Magnetic Field':
             if value != -999:
                 # set target
+                state, now_value = self.queryStateField()
+                self.ramp_done = False
+                self.monitor = RampMonitor(now_value, value, self.FIELD_TOLERANCE, self.ramp_rate)
                 command = 'CONFigure:FIELD:TARGet ' + str(value)
-                self.magnet.write(command)
-                now_value = self.performGetValue(option)
-                # ramp mode
-                command = 'RAMP'
-                self.magnet.write(command)
+                with self.lock:
+                    self.magnet.write(command)
+                    # ramp mode
+                    command = 'RAMP'
+                    self.magnet.write(command)
+            elif self.ramp_done:
+                return 'done'
             else:
-                # replace the command by the current field
-                # current command is reading the target
-                now_value = self.performGetValue(option)
-                #print('now_value', now_value, 'self.target', self.target)
+                # the monitor takes a reading at its poll interval to measure the rate,
+                # and at once when the controller holds
+                state, now_value = self.queryStateField()
+                if (self.monitor.pollDue() or state == self.HOLDING) and self.followRamp(state, now_value):
+                    return 'done'
 
         return float(now_value)
 
@@ -93,26 +144,27 @@ class Driver(DriverInterface):
         # e.g.
         if option == 'Magnetic Field':
             command = 'FIELD:MAGnet?'
-            self.magnet.write(command)
-            value = float(self.magnet.read())
+            with self.lock:
+                self.magnet.write(command)
+                value = float(self.magnet.read())
             value *= magnification
-            print(value)
         return value
 
     def experimentLinspacer(self, option, target, speed, increment):
+        self.ramp_rate = float(speed) / 3600
         if int(speed) and increment == '0':
-            time_unit = 0.1
             init = float(self.performGetValue(option, 1))
-            step = float(speed) / 3600 * time_unit
+            step = float(speed) / 3600 * self.TIME_UNIT
             if init > float(target):
                 step = -step
-            result_len = len(np.arange(init, float(target), step))+1
+            # the ramp stops with 'done' when the controller holds at the target,
+            # the placeholders only bound it to twice the expected time
+            result_len = 2*len(np.arange(init, float(target), step))+1
             result = [-999 for _ in range(result_len)]
             result[0] = float(target)
             return result
         elif int(speed) and increment != '0':
             init = float(self.performGetValue(option, 1))
-            print('increment', init)
             if init > float(target):
                 increment = -float(increment)
             result = np.arange(init, float(target), float(increment))
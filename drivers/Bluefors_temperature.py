@@ -12,6 +12,7 @@ Progress:
 
 from utils import DriverInterface
 from modpack import BlueFors
+import logging
 import os
 
 
@@ -22,8 +23,19 @@ class Driver(DriverInterface):
               'CH 5 Still',
               'CH 8 MXC',
               'CH 1 Probe']
+    # option: (log folder, channel)
+    CHANNELS = {'CH 1 50K': ('fridge', 1),
+                'CH 2  4K': ('fridge', 2),
+                'CH 3 Magnet': ('fridge', 3),
+                'CH 5 Still': ('fridge', 5),
+                'CH 8 MXC': ('fridge', 8),
+                'CH 1 Probe': ('probe', 1)}
+    # the fridge writes a line every minute, an older value is reported as stale (sec)
+    STALE_TIME = 300
 
     def __init__(self, visa_address):
+        # options whose last log line is older than STALE_TIME
+        self.stale = set()
         # The logfiles are loaded from NAS address. Please adjust this part if
         # you are using another computer.
         fridge_folder_path = "E:\\DATA\\Bluefors_log\\192.168.0.116"
@@ -61,10 +73,14 @@ class Driver(DriverInterface):
 
     def performOpen(self):
         """Perform the operation of opening the instrument connection"""
-        pass
+        # the log folders are read in the background, performGetValue reads the latest values from memory
+        self.bf_fridge.start_watcher()
+        self.bf_probe.start_watcher()
 
     def performClose(self):
         """Perform the close instrument connection operation"""
+        self.bf_fridge.stop_watcher()
+        self.bf_probe.stop_watcher()
         self.bf_fridge.close_all()
         self.bf_probe.close_all()
 
@@ -73,24 +89,14 @@ class Driver(DriverInterface):
 
     def performGetValue(self, option='0', magnification=1):
         """Perform the Get Value instrument operation"""
-        # add the command of current field here
-        # e.g.
-        if option == 'CH 1 Probe':
-            probe_channel_num = 1
-            value = self.bf_probe.get_temperature(probe_channel_num)
-        elif option == 'CH 1 50K':
-            channel_num = 1
-            value = self.bf_fridge.get_temperature(channel_num)
-        elif option == 'CH 2  4K':
-            channel_num = 2
-            value = self.bf_fridge.get_temperature(channel_num)
-        elif option == 'CH 3 Magnet':
-            channel_num = 3
-            value = self.bf_fridge.get_temperature(channel_num)
-        elif option == 'CH 5 Still':
-            channel_num = 5
-            value = self.bf_fridge.get_temperature(channel_num)
-        elif option == 'CH 8 MXC':
-            channel_num = 8
-            value = self.bf_fridge.get_temperature(channel_num)
+        folder, channel_num = self.CHANNELS[option]
+        bf = self.bf_probe if folder == 'probe' else self.bf_fridge
+        value, age = bf.latest_temperature(channel_num)
+        # warn once when the log stops, and once when it is back
+        if age > self.STALE_TIME and option not in self.stale:
+            self.stale.add(option)
+            logging.warning(f'{option}: the last log line is {age:.0f} s old')
+        elif age <= self.STALE_TIME and option in self.stale:
+            self.stale.discard(option)
+            logging.info(f'{option}: the log is updated again')
         return float(value)
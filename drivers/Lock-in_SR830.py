@@ -1,17 +1,28 @@
+from bisect import bisect_left
 from utils import DriverInterface
 from pymeasure.instruments.srs.sr830 import SR830
-from time import sleep
 
 
 class Driver(SR830, DriverInterface):
-    METHOD = ['Voltage', 'Frequency', 'Magnitude(R)', 'Magnitude(X)', 'Phase', 'Analog in 1', 'Analog in 2',
+    METHOD = ['Voltage', 'Frequency', 'Magnitude(R)', 'Magnitude(X)', 'Magnitude(Y)', 'Phase', 'Analog in 1', 'Analog in 2',
               'Magnitude(R) with auto sensitivity', 'Magnitude(X) with auto sensitivity','Triton Temperature (AUX in 3)']
+    # SNAP? parameter of each option, SNAP? reads 2 to 6 of them at the same instant
+    SNAP_CODES = {'Magnitude(X)': 1, 'Magnitude(Y)': 2, 'Magnitude(R)': 3, 'Phase': 4,
+                  'Analog in 1': 5, 'Analog in 2': 6, 'Triton Temperature (AUX in 3)': 7, 'Frequency': 9,
+                  'Magnitude(R) with auto sensitivity': 3, 'Magnitude(X) with auto sensitivity': 1}
+    SNAP_MAX = 6
+    # output settling to 99% of a step, in time constants, for each filter slope (dB/oct)
+    SETTLE_TIME_CONSTANTS = {6: 5, 12: 7, 18: 9, 24: 10}
 
     def __init__(self, visa_address):
         SR830.__init__(self, visa_address)
+        # the range is kept while the magnitude is in [LEFT, RIGHT] of the full scale,
+        # a new range puts it under TARGET, inside the band so the range does not flap
         self.SCALE_RANGE_LEFT = 0.2
         self.SCALE_RANGE_RIGHT = 0.8
-        self.ADJUST_SCALE_TIME = 1.5
+        self.SCALE_TARGET = 0.6
+        # fraction of the full scale read as an overload
+        self.OVERLOAD = 1.0
 
     def performOpen(self):
         """Perform the operation of opening the instrument connection"""
@@ -51,6 +62,8 @@ class Driver(SR830, DriverInterface):
             value = self.magnitude
         elif option == 'Magnitude(X)':
             value = self.x
+        elif option == 'Magnitude(Y)':
+            value = self.y
         elif option == 'Phase':
             value = self.theta
         elif option == 'Analog in 1':
@@ -64,44 +77,85 @@ class Driver(SR830, DriverInterface):
             self.autoSensitivity()
             value = self.x
         elif option == 'Triton Temperature (AUX in 3)':
-            if self.first_run:
-                # voltage setting in Lakeshore
-                volt_low = -10
-                volt_high = 10
-                # user-defined two temperature endpoints (K)
-                # magnification = '50,125'; scale = ['50','125']
-                scale = str(magnification).split(',')
-                endpoint_1 = float(scale[0]) # temp in [K] for -10V
-                endpoint_2 = float(scale[1]) # temp in [K] for +10V
-                if endpoint_1 > endpoint_2:
-                    endpoint_1, endpoint_2 = endpoint_2, endpoint_1
-                # Calculate the slope and intercept
-                self.slope = (endpoint_2 - endpoint_1) / (volt_high - volt_low)
-                self.intercept = self.slope * (-volt_high) + endpoint_2
-                self.first_run = False
-            # Calculate the corresponding Temperature
-            aux_volt =  self.aux_in_3
-            value = round(aux_volt*self.slope + self.intercept, 7)
-            return value
+            return self.tritonTemperature(self.aux_in_3, magnification)
         return float(value) * magnification
 
+    def performGetValues(self, options, magnifications):
+        """ Read the options with SNAP? codes in one query (2 to 6 per query),
+            the values are taken at the same instant. The others are read alone.
+        """
+        codes = [self.SNAP_CODES.get(option) for option in options]
+        snap_codes = list(dict.fromkeys(code for code in codes if code is not None))
+        if len(snap_codes) < 2:
+            return super().performGetValues(options, magnifications)
+        if any(option.endswith('with auto sensitivity') for option in options):
+            self.autoSensitivity()
+        snapped = {}
+        for i in range(0, len(snap_codes), self.SNAP_MAX):
+            chunk = snap_codes[i:i + self.SNAP_MAX]
+            # SNAP? needs two parameters, the padding one is dropped by zip
+            query = chunk if len(chunk) > 1 else chunk + [1 if chunk[0] != 1 else 2]
+            snapped.update(zip(chunk, self.values('SNAP? ' + ','.join(str(code) for code in query))))
+        values = []
+        for option, magnification, code in zip(options, magnifications, codes):
+            if code is None:
+                values.append(self.performGetValue(option, magnification))
+            elif option == 'Triton Temperature (AUX in 3)':
+                values.append(self.tritonTemperature(snapped[code], magnification))
+            else:
+                values.append(float(snapped[code]) * magnification)
+        return values
+
+    def tritonTemperature(self, aux_volt, magnification):
+        """Temperature from the AUX in 3 voltage, magnification = 'temp at -10V,temp at +10V'"""
+        if self.first_run:
+            # voltage setting in Lakeshore
+            volt_low = -10
+            volt_high = 10
+            # user-defined two temperature endpoints (K)
+            # magnification = '50,125'; scale = ['50','125']
+            scale = str(magnification).split(',')
+            endpoint_1 = float(scale[0]) # temp in [K] for -10V
+            endpoint_2 = float(scale[1]) # temp in [K] for +10V
+            if endpoint_1 > endpoint_2:
+                endpoint_1, endpoint_2 = endpoint_2, endpoint_1
+            # Calculate the slope and intercept
+            self.slope = (endpoint_2 - endpoint_1) / (volt_high - volt_low)
+            self.intercept = self.slope * (-volt_high) + endpoint_2
+            self.first_run = False
+        # Calculate the corresponding Temperature
+        return round(aux_volt*self.slope + self.intercept, 7)
+
     def autoSensitivity(self):
-        """Set voltage scale to current range"""
+        """ Set the range of the present magnitude in one step.
+            An overloaded input only tells the magnitude is over the full scale,
+            the largest range is set and the magnitude is measured again.
+        """
         if self.input_config == 'I (1 MOhm)':
             vi_factor = 1e-6
         else:
             vi_factor = 1
-        percent = self.magnitude / (self.sensitivity*vi_factor)
+        for _ in range(len(self.SENSITIVITIES)):
+            magnitude = abs(self.magnitude) / vi_factor
+            percent = magnitude / self.SENSITIVITIES[self.pos]
+            if self.SCALE_RANGE_LEFT <= percent <= self.SCALE_RANGE_RIGHT:
+                return
+            if percent >= self.OVERLOAD:
+                pos = len(self.SENSITIVITIES) - 1
+            else:
+                # smallest range with the magnitude under SCALE_TARGET of the full scale
+                pos = min(bisect_left(self.SENSITIVITIES, magnitude / self.SCALE_TARGET), len(self.SENSITIVITIES) - 1)
+            if pos == self.pos:
+                return
+            self.sensitivity = self.SENSITIVITIES[pos]
+            self.pos = pos
+            self.settle(self.settleTime())
+            if percent < self.OVERLOAD:
+                return
 
-        # Auto range
-        if percent < self.SCALE_RANGE_LEFT:
-            self.sensitivity = self.SENSITIVITIES[self.pos - 1]
-            self.pos = self.SENSITIVITIES.index(self.sensitivity)
-            sleep(self.ADJUST_SCALE_TIME)
-        elif percent > self.SCALE_RANGE_RIGHT:
-            self.sensitivity = self.SENSITIVITIES[self.pos + 1]
-            self.pos = self.SENSITIVITIES.index(self.sensitivity)
-            sleep(self.ADJUST_SCALE_TIME)
+    def settleTime(self):
+        """time for the output filter to settle after a range change (sec)"""
+        return self.SETTLE_TIME_CONSTANTS.get(self.filter_slope, 10) * self.time_constant
 
 
 if __name__ == '__main__':
@@ -1,9 +1,17 @@
 from utils import DriverInterface
+from nidaqmx.constants import AcquisitionType, SampleTimingType
+from time import perf_counter
+import numpy as np
 import nidaqmx
 
 
 class Driver(DriverInterface):
-    """ This class implements the NI cDAQ driver"""
+    """ This class implements the NI cDAQ driver
+
+        Every ao channel keeps one task for the whole run. Single values are
+        written on demand, a continuous sweep is loaded as a waveform and
+        generated on the sample clock of the cDAQ.
+    """
     METHOD = ['ao0', 'ao1', 'ao2', 'ao3']
 
     def __init__(self, visa_address):
@@ -15,40 +23,77 @@ class Driver(DriverInterface):
             task.ao_channels.add_ao_voltage_chan(f"{self.address}/ao3")
             task.write([[0], [0], [0], [0]], auto_start=True)
         self.value = 0
+        # option: nidaqmx.Task
+        self.tasks = {}
+        # option: [values, time_unit, start time] of the running waveform
+        self.sweeps = {}
+
+    def channelTask(self, option):
+        """the on-demand task of one ao channel, created at the first use"""
+        if option not in self.tasks:
+            task = nidaqmx.Task()
+            task.ao_channels.add_ao_voltage_chan(f"{self.address}/{option}")
+            task.start()
+            self.tasks[option] = task
+        return self.tasks[option]
 
     def performOpen(self):
         """Perform the operation of opening the instrument connection"""
-        pass
+        for option in self.METHOD:
+            self.channelTask(option)
 
     def performClose(self):
         """Perform the close instrument connection operation"""
-        pass
+        for option in list(self.sweeps):
+            self.stopSweep(option)
+        for task in self.tasks.values():
+            task.close()
+        self.tasks = {}
 
     def performSetValue(self, option, value, sweepRate=0.0):
         """Perform the Set Value instrument operation"""
-        if option == 'ao0':
-            with nidaqmx.Task() as task:
-                task.ao_channels.add_ao_voltage_chan(f"{self.address}/ao0")
-                task.write(value, auto_start=True)
-        elif option == 'ao1':
-            with nidaqmx.Task() as task:
-                task.ao_channels.add_ao_voltage_chan(f"{self.address}/ao1")
-                task.write(value, auto_start=True)
-        elif option == 'ao2':
-            with nidaqmx.Task() as task:
-                task.ao_channels.add_ao_voltage_chan(f"{self.address}/ao2")
-                task.write(value, auto_start=True)
-        elif option == 'ao3':
-            with nidaqmx.Task() as task:
-                task.ao_channels.add_ao_voltage_chan(f"{self.address}/ao3")
-                task.write(value, auto_start=True)
+        if option in self.METHOD:
+            self.stopSweep(option)
+            self.channelTask(option).write(value)
         self.value = value
         return value
 
     def performGetValue(self, option, magnification):
         """Perform the Get Value instrument operation"""
+        if option in self.sweeps:
+            # the sample generated now by the running waveform
+            values, time_unit, start = self.sweeps[option]
+            index = min(int((perf_counter() - start) / time_unit), len(values) - 1)
+            self.value = values[index]
         return self.value
 
+    def performSweep(self, option, values, time_unit):
+        """load the values as a finite waveform and generate it on the sample clock"""
+        if option not in self.METHOD or len(values) < 2:
+            return False
+        self.stopSweep(option)
+        values = np.asarray(values, dtype=np.float64)
+        task = self.channelTask(option)
+        task.stop()
+        task.timing.cfg_samp_clk_timing(1 / time_unit, sample_mode=AcquisitionType.FINITE,
+                                        samps_per_chan=len(values))
+        task.write(values, auto_start=False)
+        task.start()
+        self.sweeps[option] = [values, time_unit, perf_counter()]
+        return True
+
+    def stopSweep(self, option):
+        """stop the waveform, the channel holds the last generated value"""
+        if option not in self.sweeps:
+            return
+        self.performGetValue(option, 1)
+        del self.sweeps[option]
+        task = self.tasks[option]
+        task.stop()
+        # back to single values written on demand
+        task.timing.samp_timing_type = SampleTimingType.ON_DEMAND
+        task.start()
+
 
 if __name__ == '__main__':
     pass
@@ -1,13 +1,19 @@
 from utils import DriverInterface
+from modpack import RampMonitor
 from qcodes_contrib_drivers.drivers.Oxford.IPS120 import OxfordInstruments_IPS120
 import numpy as np
 
 
 class Driver(DriverInterface):
     METHOD = ['Magnetic Field', 'Sweeprate Field', 'Switch heater']
+    # the ramp points are 'nan' placeholders
+    PLACEHOLDER_SWEEP = True
+    # the ramp is done when the field is this close to the target (T)
+    FIELD_TOLERANCE = 1e-4
 
     def __init__(self, visa_address):
         self.ips120 = OxfordInstruments_IPS120('IPS120',visa_address,True)
+        self.monitor = None
 
     def performOpen(self):
         """Perform the operation of opening the instrument connection"""
@@ -45,10 +51,19 @@ class Driver(DriverInterface):
                 self.target = value
                 now_value = self.performGetValue()
                 self.ips120.field_setpoint(self.target)
+                # sweeprate_field is in T/min
+                self.monitor = RampMonitor(now_value, self.target, self.FIELD_TOLERANCE,
+                                           self.ips120.sweeprate_field() / 60)
+                self.reportStatus(self.monitor.message())
             else:
+                # every point records the field read now, the monitor takes a reading
+                # at its poll interval to measure the rate, and at once at the target
                 now_value = self.performGetValue()
-                if now_value == self.target:
-                    now_value = 'done'
+                if self.monitor.pollDue() or self.monitor.reached(now_value):
+                    done = self.monitor.update(now_value)
+                    self.reportStatus(self.monitor.message())
+                    if done:
+                        now_value = 'done'
         elif option == 'Sweeprate Field':
             self.ips120.sweeprate_field(value)
             now_value = 'done'
@@ -62,15 +77,20 @@ class Driver(DriverInterface):
         return self.ips120.field()
 
     def experimentLinspacer(self, option, target, speed, increment):
-        TIME_UNIT = 0.1
+        TIME_UNIT = self.TIME_UNIT
         init = float(self.performGetValue(option, 1))
         target = float(target)
-        MAG_SPEED = 12.0
         increment = float(increment)
         if option == 'Sweeprate Field' or option =='Switch heater':
             return [int(target)]
         if increment == 0:
-            step_num = int(abs(target-init)/MAG_SPEED*3600/TIME_UNIT)
+            # the ramp ends with 'done' when the field is there, the placeholders
+            # only bound it to twice the time expected at the present sweep rate (T/min)
+            sweeprate = float(self.ips120.sweeprate_field())
+            if sweeprate <= 0:
+                raise ValueError(f'{self}: the field sweep rate is {sweeprate} T/min, the field cannot ramp')
+            ramp_time = abs(target-init)/sweeprate*60
+            step_num = int(2*ramp_time/TIME_UNIT) + int(60/TIME_UNIT)
             result_len = len(np.linspace(init, target, step_num))
             if result_len:
                 result = ['nan' for _ in range(result_len)]
@@ -1,12 +1,34 @@
 from utils import DriverInterface
 from modpack import MercuryIps
+import numpy as np
 
 
 class Driver(MercuryIps, DriverInterface):
-    METHOD = ['Magnetic field', 'current']
+    """ Mercury iPS with three axes
 
-    def __init__(self, visa_address):
-        super().__init__(visa_address)
+        'Magnetic field' ramps the z axis, 'Field angle XY' rotates the
+        in-plane field (degree) at its present magnitude, all the axes ramp
+        together through vector_sweep at the speed of the row (T/h or
+        degree/h), within the rate limits of the axes.
+    """
+    METHOD = ['Magnetic field', 'current', 'Field angle XY']
+    # field vector rate (T/min) without a row speed, and polling of the vector ramps (sec)
+    VECTOR_RATE = 0.1
+    POLL_INTERVAL = 0.2
+
+    def __init__(self, visa_address, field_limits=None, rate_limits=None):
+        address = visa_address.strip()
+        limits = {'field_limits': field_limits, 'rate_limits': rate_limits}
+        if address.upper().startswith('GPIB'):
+            super().__init__(mode='GPIB', address=address, **limits)
+        elif address.upper().startswith('COM'):
+            super().__init__(mode='usb', com=address, **limits)
+        elif address.replace('.', '').isdigit():
+            super().__init__(mode='ip', ip_address=address, **limits)
+        else:
+            super().__init__(mode='visa', resource_name=address, **limits)
+        # speed of the sweep of each option (unit/h), given by experimentLinspacer
+        self.speeds = {}
 
     def performOpen(self):
         """Perform the operation of opening the instrument connection"""
@@ -14,15 +36,42 @@ class Driver(MercuryIps, DriverInterface):
 
     def performClose(self):
         """Perform the close instrument connection operation"""
-        pass
+        self.close()
 
-    def performSetValue(self, value, sweepRate=0.0):
-        """Perform the Set Value instrument operation"""
-        pass
+    def performSetValue(self, option, value, sweepRate=0.0):
+        """Perform the Set Value instrument operation, sweepRate in T/min overrides the row speed"""
+        field = self.field_vector()
+        speed = self.speeds.get(option, 0)
+        if option == 'Magnetic field':
+            target = np.array([field[0], field[1], float(value)])
+            rate = speed / 60
+        elif option == 'Field angle XY':
+            radius = np.hypot(field[0], field[1])
+            angle = np.radians(float(value))
+            target = np.array([radius*np.cos(angle), radius*np.sin(angle), field[2]])
+            # the field vector moves on the circle, degree/h to T/min
+            rate = radius * np.radians(speed) / 60
+        else:
+            return value
+        rate = sweepRate or rate or self.VECTOR_RATE
+        # plan_path keeps every axis within its rate limit
+        if not self.vector_sweep([target], rate=rate, poll_interval=self.POLL_INTERVAL, sleep=self.settle):
+            # stopped on the way, the axes hold where they are
+            return self.performGetValue(option)
+        return value
 
-    def performGetValue(self):
+    def performGetValue(self, option='Magnetic field', magnification=1):
         """Perform the Get Value instrument operation"""
-        pass
+        fields = self.fields_and_currents()
+        if option == 'current':
+            return fields['GRPZ'][1]
+        if option == 'Field angle XY':
+            return float(np.degrees(np.arctan2(fields['GRPY'][0], fields['GRPX'][0])))
+        return fields['GRPZ'][0]
+
+    def experimentLinspacer(self, option, target, speed, increment):
+        self.speeds[option] = abs(float(speed))
+        return super().experimentLinspacer(option, target, speed, increment)
 
 
 if __name__ == '__main__':
@@ -37,13 +37,15 @@ class QMeasCtrl:
 
     def _connectMeasureSignals(self):
         self._measurement.finished.connect(self.timeStop)
-        self._measurement.signal_txt.connect(self._database.txtUpdate)
-        self._measurement.signal_axis.connect(self._view.axisUpdate)
-        self._measurement.signal_plot.connect(self._view.plotUpdate)
+        self._measurement.signal_block.connect(self._database.txtUpdate)
+        self._measurement.signal_block.connect(self._view.axisUpdate)
+        self._measurement.signal_block.connect(self._view.plotUpdate)
         self._measurement.signal_lines.connect(self._view.saveLines)
+        self._measurement.signal_map.connect(self._view.mapUpdate)
         self._measurement.signal_progress.connect(self._view.setProgressBar)
         self._measurement.clear_progress.connect(self._view.clearProgressBar)
         self._measurement.page_information.connect(self._view.pageTwoInformation)
+        self._measurement.instrument_status.connect(self._view.statusInformation)
 
     def resumePause(self):
         self._view.resumePause()
@@ -79,10 +81,13 @@ class QMeasCtrl:
         copyfile('./ui/asset/step.txt', f'{self._view.folder_address}/{self.name}_measurement_process.txt')
         self._view.procedureGo(self.name)
         self._database.setUnits(self._view.units)
+        self._database.storeOpen(f'{self._view.folder_address}/{self.name}')
         # Create a worker object
         self._measurement = None
         self._measurement = MeasurementQt()
-        self._measurement.setInfo(self._view.instruments, self._view.instruments_read, self._view.options_read, self._view.instruments_magnification, self._view.tree_info)
+        self._measurement.setInfo(self._view.instruments, self._view.instruments_read, self._view.options_read, self._view.instruments_magnification, self._view.tree_info,
+                                  parallel_read=self._view.ui.actionParallelRead.isChecked(),
+                                  sample_periods=self._view.sample_periods)
         # Move worker to the thread
         self._measurement.moveToThread(self.exp_thread)
         # porcedure start
@@ -102,8 +107,14 @@ class QMeasCtrl:
         # Save current view here (auto plot save)
         self._view.plotSave()
         # Merge data
+        self._database.txtClose()
+        self._database.storeClose()
         if self._view.folder_address:
-            self._database.txtMerger(f'{self._view.folder_address}/{self.name}', file_count, self._view.read_len+1)
+            try:
+                self._database.txtMerger(f'{self._view.folder_address}/{self.name}', file_count, self._view.read_len+1)
+            except Exception as e:
+                logging.exception('merge error')
+                self._view.pageTwoInformation(f'The merge failed ({e}), the sequence files are kept in ./data until the next run.')
         self.exp_thread.quit()
         self.exp_thread.wait()
 
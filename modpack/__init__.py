@@ -2,3 +2,4 @@ from .bluefors import BlueFors
 from .ips120 import IPS120
 from .mercuryips_GPIB import MercuryIps
 from .time_measurement import TimeMeasurement
+from .ramp_monitor import RampMonitor
@@ -2,13 +2,179 @@
 # Etienne Dumur <etienne.dumur@gmail.com>, september 2020
 
 import os
-import pandas as pd
+import time
+import threading
 import numpy as np
 from datetime import date
 from qcodes.instrument.base import Instrument
 import datetime
 
 
+class LogTail:
+    """
+    Incremental reader of a growing log file.
+    The byte offset of the previous read is kept, so only the appended bytes
+    are read and only complete lines are returned. A partial trailing line
+    is kept until the end of the line is written.
+    """
+
+    # at the first read only the end of the file is needed for the last line
+    TAIL_BYTES = 4096
+
+    def __init__(self, file_path: str) -> None:
+        self.file_path = file_path
+        self.offset = None
+        self.partial = b''
+        self.last_line = None
+
+    def read_lines(self) -> list:
+        """
+        Return the complete lines appended since the previous call.
+        """
+        size = os.path.getsize(self.file_path)
+        skip_first = False
+        if self.offset is None:
+            self.offset = max(size - self.TAIL_BYTES, 0)
+            # the first line may start before the offset
+            skip_first = self.offset > 0
+        elif size < self.offset:
+            # the file was truncated or replaced
+            self.offset = 0
+            self.partial = b''
+        if size == self.offset:
+            return []
+
+        with open(self.file_path, 'rb') as f:
+            f.seek(self.offset)
+            data = f.read(size - self.offset)
+        self.offset += len(data)
+
+        lines = (self.partial + data).split(b'\n')
+        self.partial = lines.pop()
+        if skip_first and lines:
+            lines.pop(0)
+        lines = [line.decode('ascii', 'replace').strip() for line in lines]
+        lines = [line for line in lines if line]
+        if lines:
+            self.last_line = lines[-1]
+        return lines
+
+
+class LogIndex:
+    """
+    Persistent index of a log file: byte offset and time of every complete line.
+    The index is saved next to the other indexes in index_path and extended
+    with the appended lines only, so a file is parsed once. Lines between two
+    times are then found by binary search and read with a single seek.
+    """
+
+    def __init__(self, file_path: str, index_path: str) -> None:
+        self.file_path = file_path
+        self.index_file = os.path.join(index_path, os.path.basename(os.path.dirname(file_path)),
+                                       os.path.basename(file_path)+'.npz')
+        self.offsets = np.zeros(0, dtype=np.int64)
+        self.times = np.zeros(0, dtype='datetime64[s]')
+        # number of bytes already indexed
+        self.size = 0
+        if os.path.exists(self.index_file):
+            try:
+                with np.load(self.index_file) as index:
+                    self.offsets = index['offsets']
+                    self.times = index['times']
+                    self.size = int(index['size'])
+            except (OSError, KeyError, ValueError):
+                pass
+
+    @staticmethod
+    def parse_times(lines: list) -> np.ndarray:
+        """
+        Return the times of the lines ' dd-mm-yy,HH:MM:SS,...' as datetime64[s].
+        """
+
+        dates = [line[:20].strip().split(',') for line in lines]
+        return np.array(['20'+d[0][6:8]+'-'+d[0][3:5]+'-'+d[0][0:2]+'T'+d[1] for d in dates],
+                        dtype='datetime64[s]')
+
+    def update(self) -> None:
+        """
+        Index the lines appended since the last update and save the index.
+        """
+
+        size = os.path.getsize(self.file_path)
+        if size < self.size:
+            # the file was replaced
+            self.offsets = np.zeros(0, dtype=np.int64)
+            self.times = np.zeros(0, dtype='datetime64[s]')
+            self.size = 0
+        if size == self.size:
+            return
+
+        with open(self.file_path, 'rb') as f:
+            f.seek(self.size)
+            data = f.read(size - self.size)
+        # only the complete lines
+        data = data[:data.rfind(b'\n')+1]
+        if not data:
+            return
+
+        offsets = []
+        lines = []
+        position = self.size
+        for line in data.split(b'\n')[:-1]:
+            text = line.decode('ascii', 'replace')
+            if text.strip():
+                offsets.append(position)
+                lines.append(text)
+            position += len(line) + 1
+        try:
+            times = self.parse_times(lines)
+        except (IndexError, ValueError):
+            # skip the lines that cannot be parsed, one by one
+            valid = []
+            for n, line in enumerate(lines):
+                try:
+                    self.parse_times([line])
+                    valid.append(n)
+                except (IndexError, ValueError):
+                    pass
+            offsets = [offsets[n] for n in valid]
+            times = self.parse_times([lines[n] for n in valid])
+
+        self.offsets = np.concatenate([self.offsets, np.asarray(offsets, dtype=np.int64)])
+        self.times = np.concatenate([self.times, times])
+        self.size = position
+        self.save()
+
+    def save(self) -> None:
+        os.makedirs(os.path.dirname(self.index_file), exist_ok=True)
+        temp_file = self.index_file+'.tmp'
+        with open(temp_file, 'wb') as f:
+            np.savez(f, offsets=self.offsets, times=self.times, size=self.size)
+        os.replace(temp_file, self.index_file)
+
+    def lines(self, start: np.datetime64, end: np.datetime64) -> tuple:
+        """
+        Return the times and the lines logged between start and end (included).
+        Only the indexed lines are returned, the ones that could not be parsed
+        are left out.
+        """
+
+        first = np.searchsorted(self.times, start, side='left')
+        last = np.searchsorted(self.times, end, side='right')
+        if first >= last:
+            return self.times[:0], []
+        offsets = self.offsets[first:last]
+        end_offset = self.offsets[last] if last < len(self.offsets) else self.size
+        with open(self.file_path, 'rb') as f:
+            f.seek(offsets[0])
+            data = f.read(end_offset - offsets[0])
+        lines = []
+        for offset in offsets - offsets[0]:
+            line_end = data.find(b'\n', offset)
+            lines.append(data[offset:line_end].decode('ascii', 'replace'))
+        return self.times[first:last], lines
+
+
 class BlueFors(Instrument):
     """
     This is the QCoDeS python driver to extract the temperature and pressure
@@ -28,6 +194,7 @@ class BlueFors(Instrument):
                        channel_still             : int,
                        channel_mixing_chamber    : int,
                        channel_magnet            : int=None,
+                       index_path                : str=None,
                        **kwargs) -> None:
         """
         QCoDeS driver for BlueFors fridges.
@@ -48,11 +215,32 @@ class BlueFors(Instrument):
         channel_still: channel of the still.
         channel_mixing_chamber: channel of the mixing chamber.
         channel_magnet: channel of the magnet.
+        index_path: folder of the persistent indexes used by the range
+            queries, ~/.bluefors_index/<log folder name> by default.
         """
 
         super().__init__(name = name, **kwargs)
 
         self.folder_path = os.path.abspath(folder_path)
+        # LogTail of the log files of today and yesterday
+        self._tails = {}
+        self._tails_lock = threading.Lock()
+
+        # latest values read by the watcher {(kind, channel): (value, timestamp)}
+        self._temperature_channels = [channel for channel in (channel_50k_plate, channel_4k_plate, channel_magnet,
+                                                              channel_still, channel_mixing_chamber)
+                                      if channel is not None]
+        self._pressure_channels = [channel_vacuum_can, channel_pumping_line, channel_compressor_outlet,
+                                   channel_compressor_inlet, channel_mixture_tank, channel_venting_line]
+        self._latest = {}
+        self._watcher = None
+        self._watcher_stop = threading.Event()
+
+        # LogIndex of the files used by the range queries
+        if index_path is None:
+            index_path = os.path.join(os.path.expanduser('~'), '.bluefors_index', os.path.basename(self.folder_path))
+        self.index_path = index_path
+        self._indexes = {}
 
         self.add_parameter(name       = 'pressure_vacuum_can',
                            unit       = 'mBar',
@@ -135,6 +323,47 @@ class BlueFors(Instrument):
         self.connect_message()
 
 
+    def _last_line(self, log_name: str) -> str:
+        """
+        Return the last complete line of the log 'log_name yy-mm-dd.log' of
+        the current day. Just after midnight, while the new file has no line
+        yet, the last line of the previous day is returned.
+
+        Args:
+            log_name (str): Beginning of the file name, e.g. 'CH1 T'.
+
+        Returns:
+            line (str): 'dd-mm-yy,HH:MM:SS,...' without the leading space.
+        """
+
+        with self._tails_lock:
+            return self._read_last_line(log_name)
+
+    def _read_last_line(self, log_name: str) -> str:
+        today = date.today()
+        file_paths = []
+        for day in (today, today - datetime.timedelta(days=1)):
+            folder_name = day.strftime("%y-%m-%d")
+            file_paths.append(os.path.join(self.folder_path, folder_name, log_name+' '+folder_name+'.log'))
+
+        for file_path in file_paths:
+            if file_path not in self._tails:
+                if not os.path.exists(file_path):
+                    continue
+                self._tails[file_path] = LogTail(file_path)
+            tail = self._tails[file_path]
+            tail.read_lines()
+            if tail.last_line is not None:
+                break
+        else:
+            raise FileNotFoundError(f'No line in {file_paths[0]}')
+
+        # forget the files of the previous days
+        for file_path in [path for path in self._tails if path not in file_paths]:
+            del self._tails[file_path]
+
+        return tail.last_line
+
     def get_temperature(self, channel: int) -> float:
         """
         Return the last registered temperature of the current day for the
@@ -147,25 +376,14 @@ class BlueFors(Instrument):
             temperature (float): Temperature of the channel in Kelvin.
         """
 
-        folder_name = date.today().strftime("%y-%m-%d")
-        file_path = os.path.join(self.folder_path, folder_name, 'CH'+str(channel)+' T '+folder_name+'.log')
-
         try:
-            df = pd.read_csv(file_path,
-                             delimiter=',',
-                             names=['date', 'time', 'y'],
-                             header=None)
-
-            # There is a space before the day
-            df.index = pd.to_datetime(
-                df['date']+'-'+df['time'], format='%d-%m-%y-%H:%M:%S')
-
-            return df.iloc[-1]['y']
+            # date, time, temperature
+            return float(self._last_line('CH'+str(channel)+' T').split(',')[2])
         except (PermissionError, OSError) as err:
             self.log.warn(
                 f'\n{datetime.datetime.now()}\nCannot access log file: {err}. Returning np.nan instead of the temperature value.')
             return np.nan
-        except IndexError as err:
+        except (IndexError, ValueError) as err:
             self.log.warn(
                 f'\n{datetime.datetime.now()}\nCannot parse log file: {err}. Returning np.nan instead of the temperature value.')
             return np.nan
@@ -182,29 +400,169 @@ class BlueFors(Instrument):
             pressure (float): Pressure of the channel in mBar.
         """
 
-        folder_name = date.today().strftime("%y-%m-%d")
-        file_path = os.path.join(self.folder_path, folder_name, 'maxigauge '+folder_name+'.log')
-
         try:
-            df = pd.read_csv(file_path,
-                             delimiter=',',
-                             names=['date', 'time',
-                                    'ch1_name', 'ch1_void1', 'ch1_status', 'ch1_pressure', 'ch1_void2', 'ch1_void3',
-                                    'ch2_name', 'ch2_void1', 'ch2_status', 'ch2_pressure', 'ch2_void2', 'ch2_void3',
-                                    'ch3_name', 'ch3_void1', 'ch3_status', 'ch3_pressure', 'ch3_void2', 'ch3_void3',
-                                    'ch4_name', 'ch4_void1', 'ch4_status', 'ch4_pressure', 'ch4_void2', 'ch4_void3',
-                                    'ch5_name', 'ch5_void1', 'ch5_status', 'ch5_pressure', 'ch5_void2', 'ch5_void3',
-                                    'ch6_name', 'ch6_void1', 'ch6_status', 'ch6_pressure', 'ch6_void2', 'ch6_void3',
-                                    'void'],
-                             header=None)
-
-            df.index = pd.to_datetime(df['date']+'-'+df['time'], format='%d-%m-%y-%H:%M:%S')
-
-            return df.iloc[-1]['ch'+str(channel)+'_pressure']
+            # date, time, then name, void, status, pressure, void, void for each of the 6 channels
+            return float(self._last_line('maxigauge').split(',')[2 + 6*(channel-1) + 3])
         except (PermissionError, OSError) as err:
             self.log.warn('Cannot access log file: {}. Returning np.nan instead of the pressure value.'.format(err))
             return np.nan
-        except IndexError as err:
+        except (IndexError, ValueError) as err:
             self.log.warn('Cannot parse log file: {}. Returning np.nan instead of the pressure value.'.format(err))
             return np.nan
-            
\ No newline at end of file
+
+    def start_watcher(self, poll_interval: float=1.0) -> None:
+        """
+        Read the new lines of the temperature channels and of the maxigauge
+        file in a background thread every poll_interval seconds. The latest
+        values are then returned from memory by latest_temperature and
+        latest_pressure.
+
+        Args:
+            poll_interval (float): Time between two reads of the log files in second.
+        """
+
+        if self._watcher is not None:
+            return
+        self._refresh()
+        self._watcher_stop.clear()
+        self._watcher = threading.Thread(target=self._watch, args=(poll_interval,), daemon=True)
+        self._watcher.start()
+
+    def stop_watcher(self) -> None:
+        """
+        Stop the background thread started by start_watcher.
+        """
+
+        if self._watcher is None:
+            return
+        self._watcher_stop.set()
+        self._watcher.join()
+        self._watcher = None
+
+    def _watch(self, poll_interval: float) -> None:
+        while not self._watcher_stop.wait(poll_interval):
+            self._refresh()
+
+    def _refresh(self) -> None:
+        """
+        Update the latest value table from the new lines of the log files.
+        A value that cannot be read keeps its previous timestamp and becomes stale.
+        """
+
+        for channel in self._temperature_channels:
+            try:
+                fields = self._last_line('CH'+str(channel)+' T').split(',')
+                self._store('temperature', channel, fields, float(fields[2]))
+            except (OSError, IndexError, ValueError):
+                pass
+
+        try:
+            fields = self._last_line('maxigauge').split(',')
+        except OSError:
+            return
+        for channel in self._pressure_channels:
+            try:
+                self._store('pressure', channel, fields, float(fields[2 + 6*(channel-1) + 3]))
+            except (IndexError, ValueError):
+                pass
+
+    def _store(self, kind: str, channel: int, fields: list, value: float) -> None:
+        timestamp = datetime.datetime.strptime(fields[0]+'-'+fields[1], '%d-%m-%y-%H:%M:%S').timestamp()
+        # a single assignment, the readers never see a half updated entry
+        self._latest[(kind, channel)] = (value, timestamp)
+
+    def _latest_value(self, kind: str, channel: int) -> tuple:
+        value, timestamp = self._latest.get((kind, channel), (np.nan, -np.inf))
+        return value, time.time() - timestamp
+
+    def latest_temperature(self, channel: int) -> tuple:
+        """
+        Return the latest temperature read by the watcher, without file access.
+
+        Args:
+            channel (int): Channel from which the temperature is extracted.
+
+        Returns:
+            temperature (float): Temperature of the channel in Kelvin, np.nan if never read.
+            age (float): Time since the temperature was logged in second, used to detect stale values.
+        """
+
+        return self._latest_value('temperature', channel)
+
+    def latest_pressure(self, channel: int) -> tuple:
+        """
+        Return the latest pressure read by the watcher, without file access.
+
+        Args:
+            channel (int): Channel from which the pressure is extracted.
+
+        Returns:
+            pressure (float): Pressure of the channel in mBar, np.nan if never read.
+            age (float): Time since the pressure was logged in second, used to detect stale values.
+        """
+
+        return self._latest_value('pressure', channel)
+
+    def _query(self, log_name: str, column: int, start: datetime.datetime, end: datetime.datetime) -> tuple:
+        """
+        Return the times and the values of a column of the logs 'log_name
+        yy-mm-dd.log' between start and end, over all the day folders.
+        """
+
+        start = np.datetime64(start, 's')
+        end = np.datetime64(end, 's')
+        times = []
+        values = []
+        day = start.astype('datetime64[D]')
+        while day <= end.astype('datetime64[D]'):
+            folder_name = day.item().strftime("%y-%m-%d")
+            file_path = os.path.join(self.folder_path, folder_name, log_name+' '+folder_name+'.log')
+            day += 1
+            if not os.path.exists(file_path):
+                continue
+            if file_path not in self._indexes:
+                self._indexes[file_path] = LogIndex(file_path, self.index_path)
+            index = self._indexes[file_path]
+            index.update()
+            # the times come from the index, only the values are parsed
+            for timestamp, line in zip(*index.lines(start, end)):
+                try:
+                    value = float(line.split(',')[column])
+                except (IndexError, ValueError):
+                    continue
+                times.append(timestamp)
+                values.append(value)
+
+        return np.array(times, dtype='datetime64[s]'), np.array(values, dtype=np.float64)
+
+    def temperature(self, channel: int, start: datetime.datetime, end: datetime.datetime) -> tuple:
+        """
+        Return the temperatures logged between start and end.
+
+        Args:
+            channel (int): Channel from which the temperature is extracted.
+            start (datetime): Beginning of the range, local time.
+            end (datetime): End of the range (included), local time.
+
+        Returns:
+            times (np.ndarray): Times of the values, datetime64[s] in local time.
+            temperatures (np.ndarray): Temperatures of the channel in Kelvin.
+        """
+
+        return self._query('CH'+str(channel)+' T', 2, start, end)
+
+    def pressure(self, channel: int, start: datetime.datetime, end: datetime.datetime) -> tuple:
+        """
+        Return the pressures logged between start and end.
+
+        Args:
+            channel (int): Channel from which the pressure is extracted.
+            start (datetime): Beginning of the range, local time.
+            end (datetime): End of the range (included), local time.
+
+        Returns:
+            times (np.ndarray): Times of the values, datetime64[s] in local time.
+            pressures (np.ndarray): Pressures of the channel in mBar.
+        """
+
+        return self._query('maxigauge', 2 + 6*(channel-1) + 3, start, end)
@@ -14,10 +14,10 @@ Classes:
     ips120: a class for interfacing with a IPS 120-10 magnet power supply
 
 """
-from datetime import datetime
 import time
 import logging
 import pyvisa as visa
+from .ramp_monitor import RampMonitor
 
 # create a logger object for this module
 logger = logging.getLogger(__name__)
@@ -239,19 +239,21 @@ class IPS120:
         Returns:
             (bool): whether the field set point was reached
         """
-        start_time = datetime.now()
-        stop_time = start_time + datetime.timedelta(seconds=timeout)
-
-        while datetime.now() < stop_time:
-            field = self.readField()
-            set_point = self.readFieldSetpoint()
-
-            if abs(field - set_point) < error_margin:
-                return True
-
-            time.sleep(5)
-
-        return False
+        set_point = self.readFieldSetpoint()
+        # readFieldSweepRate is in Tesla/min
+        monitor = RampMonitor(self.readField(), set_point, error_margin, self.readFieldSweepRate() / 60)
+        stop_time = time.perf_counter() + timeout
+
+        while not monitor.done:
+            # the polls get denser as the predicted end of the ramp comes closer
+            wait = min(monitor.nextPoll(), stop_time - time.perf_counter())
+            if wait < 0:
+                return False
+            time.sleep(wait)
+            monitor.update(self.readField())
+            logger.debug(monitor.message())
+
+        return True
 
     def shutDown(self):
         self._visa_resource.close()
@@ -4,6 +4,9 @@ Created on Fri May  7 20:22:07 2021
 @author: Tsung-Lin
 """
 import socket
+import threading
+import time
+import numpy as np
 import pyvisa as visa
 import serial
 # =============================================================================
@@ -11,8 +14,170 @@ import serial
 # =============================================================================
 
 
+class VisaPool:
+    """
+    VISA sessions of the Mercury iPS shared by the three axes, keyed by the
+    resource address. A session stays open across queries and the queries
+    on one address are serialized by its lock. A failed query reopens the
+    session and is retried at most RETRIES times, waiting BACKOFF seconds
+    before the first retry and twice as long before each next one.
+    """
+    RETRIES = 3
+    BACKOFF = 0.05
+
+    _resource_manager = None
+    _sessions = {}
+    _locks = {}
+    _pool_lock = threading.Lock()
+
+    @classmethod
+    def lock(cls, address):
+        with cls._pool_lock:
+            return cls._locks.setdefault(address, threading.Lock())
+
+    @classmethod
+    def session(cls, address, timeout):
+        """The open session of the address, opened (and cleared) if needed. Call with the lock."""
+        if address not in cls._sessions:
+            with cls._pool_lock:
+                if cls._resource_manager is None:
+                    cls._resource_manager = visa.ResourceManager()
+            session = cls._resource_manager.open_resource(address)
+            session.timeout = timeout * 1000
+            session.clear()
+            cls._sessions[address] = session
+        return cls._sessions[address]
+
+    @classmethod
+    def drop(cls, address):
+        """Close the session of the address, the next query opens a new one. Call with the lock."""
+        session = cls._sessions.pop(address, None)
+        if session is not None:
+            try:
+                session.close()
+            except visa.VisaIOError:
+                pass
+
+    @classmethod
+    def query(cls, address, command, timeout=10.0):
+        """Write the command and read the response, retried on error or on an INVALID response.
+
+        :param address: VISA resource name
+        :param command: The command, which should be in the NOUN + VERB format
+        :param timeout: Time to wait for a response in seconds
+        :returns str: The response
+        """
+        with cls.lock(address):
+            delay = cls.BACKOFF
+            for attempt in range(cls.RETRIES + 1):
+                try:
+                    session = cls.session(address, timeout)
+                    session.write(command)
+                    response = session.read()
+                    if 'INVALID' not in response:
+                        return response
+                    error = RuntimeError(f'INVALID response to {command.strip()}')
+                except (visa.VisaIOError, OSError) as e:
+                    error = e
+                    cls.drop(address)
+                if attempt < cls.RETRIES:
+                    time.sleep(delay)
+                    delay *= 2
+            raise error
+
+    @classmethod
+    def close(cls, address):
+        with cls.lock(address):
+            cls.drop(address)
+
+
+class TcpTransport:
+    """
+    Persistent TCP connection to a Mercury iPS, shared by the three axes and
+    keyed by (ip_address, port). Every command and every response is one
+    line, so several commands can be sent in one write and their responses
+    read back in order (pipelining). A broken connection is reopened and the
+    commands are sent once more.
+    """
+    _transports = {}
+    _pool_lock = threading.Lock()
+
+    @classmethod
+    def get(cls, ip_address, port, timeout=10.0):
+        with cls._pool_lock:
+            key = (ip_address, port)
+            if key not in cls._transports:
+                cls._transports[key] = cls(ip_address, port, timeout)
+            return cls._transports[key]
+
+    def __init__(self, ip_address, port, timeout=10.0):
+        self.ip_address = ip_address
+        self.port = port
+        self.timeout = timeout
+        self.sock = None
+        self.buffer = b''
+        self.lock = threading.Lock()
+
+    def connect(self):
+        self.sock = socket.create_connection((self.ip_address, self.port), timeout=self.timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.buffer = b''
+
+    def close(self):
+        with self.lock:
+            self.disconnect()
+
+    def disconnect(self):
+        if self.sock is not None:
+            try:
+                self.sock.close()
+            except OSError:
+                pass
+        self.sock = None
+        self.buffer = b''
+
+    def readline(self):
+        """One response, with its line feed."""
+        while b'\n' not in self.buffer:
+            data = self.sock.recv(4096)
+            if not data:
+                raise ConnectionError('Connection closed by the MercuryIPS')
+            self.buffer += data
+        line, self.buffer = self.buffer.split(b'\n', 1)
+        return line.decode() + '\n'
+
+    def query(self, command):
+        return self.query_many([command])[0]
+
+    def query_many(self, commands):
+        """Sends the commands in one write and returns their responses in the same order.
+
+        :param commands: The commands, which should be in the NOUN + VERB format
+        :type commands: list
+        :returns list: The MercuryIPS responses
+        """
+        data = ''.join(command if command.endswith('\n') else command + '\n' for command in commands).encode()
+        with self.lock:
+            for attempt in range(2):
+                try:
+                    if self.sock is None:
+                        self.connect()
+                    self.sock.sendall(data)
+                    return [self.readline() for _ in commands]
+                except OSError:
+                    # includes the timeout, the late responses would shift the next ones
+                    self.disconnect()
+                    if attempt:
+                        raise
+
+
 class MercuryIps:
 
+    # default field limit (T) and ramp rate limit (T/min) of each axis, the
+    # limits of the connected magnet are given to the constructor
+    FIELD_LIMITS = {'GRPX': 1.0, 'GRPY': 1.0, 'GRPZ': 12.0}
+    RATE_LIMITS = {'GRPX': 0.1, 'GRPY': 0.1, 'GRPZ': 0.2}
+
     # Magnet class
 
     class Magnet:
@@ -47,11 +212,14 @@ class MercuryIps:
 #             self.bytes_to_read = bytes_to_read
 # =============================================================================
 
-        def __init__(self, axis, mode='usb', resource_name=None, address=None, com=None, timeout=10.0, bytes_to_read=1024):
+        def __init__(self, axis, mode='usb', resource_name=None, address=None, com=None, timeout=10.0, bytes_to_read=1024,
+                     ip_address=None, port=7020):
             self.axis = axis
             self.mode = mode
             self.resource_name = resource_name
-            self.resource_manager = visa.ResourceManager()
+            self.ip_address = ip_address
+            self.port = port
+            # the VISA sessions are shared by the axes in VisaPool
             self.address = address
             self.com = com
             self.timeout = timeout
@@ -72,18 +240,7 @@ class MercuryIps:
             :type command: string
             :returns str: The MercuryIPS response
             """
-            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                s.connect((self.ip_address, self.port))
-                s.settimeout(self.timeout)
-                s.sendall(command.encode())
-                response = s.recv(self.bytes_to_read).decode()
-                s.sendall(''.encode())
-                s.sendall(''.encode())
-# =============================================================================
-#                 print('query result:', response)
-# =============================================================================
-
-            return response
+            return TcpTransport.get(self.ip_address, self.port, self.timeout).query(command)
 
         def query_usb(self, command):
             """Sends a query to the MercuryIPS via ethernet.
@@ -99,30 +256,13 @@ class MercuryIps:
             return response
 
         def query_GPIB(self, command):
-            """Sends a query to the MercuryIPS via ethernet.
+            """Sends a query to the MercuryIPS via GPIB.
 
             :param command: The command, which should be in the NOUN + VERB format
             :type command: string
             :returns str: The MercuryIPS response
             """
-
-            with self.resource_manager.open_resource(self.address) as self.instrument:
-
-                self.instrument.clear()
-                self.instrument.write(command)
-                response = self.instrument.read()
-# =============================================================================
-#                 print('query ',response,'.')
-# =============================================================================
-            while 'INVALID' in response:
-                with self.resource_manager.open_resource(self.address) as self.instrument:
-                    self.instrument.clear()
-                    self.instrument.write(command)
-                    response = self.instrument.read()
-# =============================================================================
-#                     print('query ',response,'.')
-# =============================================================================
-            return response
+            return VisaPool.query(self.address, command, self.timeout)
 
         def query_visa(self, command):
             """Sends a query to the MercuryIPS via VISA.
@@ -131,11 +271,7 @@ class MercuryIps:
             :type command: string
             :returns str: The MercuryIPS response
             """
-            instr = self.resource_manager.open_resource(self.resource_name)
-            response = instr.query(command)
-            instr.close()
-
-            return response
+            return VisaPool.query(self.resource_name, command, self.timeout)
 
         @staticmethod
         def extract_value(response, noun, unit):
@@ -340,7 +476,8 @@ class MercuryIps:
 
     def __init__(self, mode='GPIB',
                  resource_name=None,
-                 ip_address=None, com='com3', address='GPIB0::25::1::INSTR', port=7020, timeout=10.0, bytes_to_read=1024):
+                 ip_address=None, com='com3', address='GPIB0::25::1::INSTR', port=7020, timeout=10.0, bytes_to_read=1024,
+                 field_limits=None, rate_limits=None):
         """
         Parameters:
         :param str mode: The connection to the iPS, either 'ip' or 'visa'
@@ -352,6 +489,8 @@ class MercuryIps:
         :type timeout: float
         :param bytes_to_read: Number of bytes to read from query
         :type bytes_to_read: integer
+        :param dict field_limits: Field limit (T) of the axes, {'GRPX': ..., 'GRPY': ..., 'GRPZ': ...}, FIELD_LIMITS for the missing ones
+        :param dict rate_limits: Ramp rate limit (T/min) of the axes, RATE_LIMITS for the missing ones
         """
         supported_modes = ('ip', 'visa', 'usb', 'GPIB')
 
@@ -359,13 +498,181 @@ class MercuryIps:
             self.mode = mode
         else:
             raise RuntimeError('Mode is not currently supported.')
+        self.field_limits = {**self.FIELD_LIMITS, **(field_limits or {})}
+        self.rate_limits = {**self.RATE_LIMITS, **(rate_limits or {})}
 
         self.x_magnet = MercuryIps.Magnet('GRPX', mode=mode, resource_name=resource_name, address=address,
-                                          com=com, timeout=timeout, bytes_to_read=bytes_to_read)
+                                          com=com, timeout=timeout, bytes_to_read=bytes_to_read,
+                                          ip_address=ip_address, port=port)
         self.y_magnet = MercuryIps.Magnet('GRPY', mode=mode, resource_name=resource_name, address=address,
-                                          com=com, timeout=timeout, bytes_to_read=bytes_to_read)
+                                          com=com, timeout=timeout, bytes_to_read=bytes_to_read,
+                                          ip_address=ip_address, port=port)
         self.z_magnet = MercuryIps.Magnet('GRPZ', mode=mode, resource_name=resource_name, address=address,
-                                          com=com, timeout=timeout, bytes_to_read=bytes_to_read)
+                                          com=com, timeout=timeout, bytes_to_read=bytes_to_read,
+                                          ip_address=ip_address, port=port)
+
+    def query_many(self, commands):
+        """Sends several queries, in a single round trip in 'ip' mode.
+
+        :param commands: The commands, which should be in the NOUN + VERB format
+        :type commands: list
+        :returns list: The MercuryIPS responses in the same order
+        """
+        magnet = self.x_magnet
+        if self.mode == 'ip':
+            return TcpTransport.get(magnet.ip_address, magnet.port, magnet.timeout).query_many(commands)
+        return [MercuryIps.Magnet.QUERY_AND_RECEIVE[self.mode](magnet, command) for command in commands]
 
-    def circle_sweep(self, field_radius, number_points):
-        pass
+    def fields_and_currents(self):
+        """Reads the field (T) and the current (A) of the three axes with one query_many.
+
+        :returns dict: {'GRPX': (field, current), 'GRPY': ..., 'GRPZ': ...}
+        """
+        magnets = (self.x_magnet, self.y_magnet, self.z_magnet)
+        nouns = []
+        for magnet in magnets:
+            nouns.append(('DEV:' + magnet.axis + ':PSU:SIG:FLD', 'T'))
+            nouns.append(('DEV:' + magnet.axis + ':PSU:SIG:CURR', 'A'))
+        responses = self.query_many(['READ:' + noun + '\n' for noun, _ in nouns])
+        values = [MercuryIps.Magnet.extract_value(response, noun, unit)
+                  for response, (noun, unit) in zip(responses, nouns)]
+        return {magnet.axis: (values[2*n], values[2*n+1]) for n, magnet in enumerate(magnets)}
+
+    def close(self):
+        """Close the connection shared by the three axes."""
+        if self.mode == 'ip':
+            TcpTransport.get(self.x_magnet.ip_address, self.x_magnet.port).close()
+        elif self.mode == 'GPIB':
+            VisaPool.close(self.x_magnet.address)
+        elif self.mode == 'visa':
+            VisaPool.close(self.x_magnet.resource_name)
+
+    # =============================================================================
+    # Vector field sweeps
+    # =============================================================================
+
+    @property
+    def magnets(self):
+        return (self.x_magnet, self.y_magnet, self.z_magnet)
+
+    def field_vector(self):
+        """The magnetic field (Bx, By, Bz) in Tesla, read in one query_many."""
+        fields = self.fields_and_currents()
+        return np.array([fields[magnet.axis][0] for magnet in self.magnets])
+
+    @staticmethod
+    def circle_path(field_radius, number_points, plane='xy', offset=0.0):
+        """Points of a full circle, the first point is repeated at the end.
+
+        :param field_radius: Radius of the circle in Tesla
+        :param number_points: Number of points on the circle
+        :param plane: 'xy', 'xz' or 'yz'
+        :param offset: Field along the third axis in Tesla
+        :returns np.ndarray: (number_points + 1, 3) fields in Tesla
+        """
+        angles = np.linspace(0, 2*np.pi, number_points + 1)
+        points = np.full((number_points + 1, 3), float(offset))
+        axes = ['xyz'.index(axis) for axis in plane]
+        points[:, axes[0]] = field_radius * np.cos(angles)
+        points[:, axes[1]] = field_radius * np.sin(angles)
+        return points
+
+    @staticmethod
+    def spherical_grid(field_radius, number_theta, number_phi):
+        """Points of a sphere on a (theta, phi) grid, phi goes back and forth to keep the steps short.
+
+        :param field_radius: Field magnitude in Tesla
+        :param number_theta: Number of polar angles from 0 to pi
+        :param number_phi: Number of azimuthal angles from 0 to 2 pi (excluded)
+        :returns np.ndarray: (number_theta * number_phi, 3) fields in Tesla
+        """
+        points = []
+        phis = np.linspace(0, 2*np.pi, number_phi, endpoint=False)
+        for n, theta in enumerate(np.linspace(0, np.pi, number_theta)):
+            for phi in (phis if n % 2 == 0 else phis[::-1]):
+                points.append([np.sin(theta)*np.cos(phi), np.sin(theta)*np.sin(phi), np.cos(theta)])
+        return field_radius * np.array(points)
+
+    def plan_path(self, points, rate=None, start=None):
+        """Synchronized per-axis ramps through the points.
+
+        Every segment is given the shortest duration allowed by the rate
+        limits of all the axes (and by the vector rate), then each axis ramps
+        at |delta| / duration, so the three axes reach the point together.
+
+        :param points: (N, 3) fields in Tesla
+        :param rate: Maximum rate of the field vector in Tesla per minute, None for the axis limits only
+        :param start: Field at the start, the present field by default
+        :returns list: [(setpoint, rates in T/min, duration in min), ...]
+        """
+        points = np.atleast_2d(np.asarray(points, dtype=float))
+        limits = np.array([self.field_limits[magnet.axis] for magnet in self.magnets])
+        if (np.abs(points) > limits).any():
+            raise RuntimeError("The setpoint must be within the proper limits.")
+        rate_limits = np.array([self.rate_limits[magnet.axis] for magnet in self.magnets])
+        previous = self.field_vector() if start is None else np.asarray(start, dtype=float)
+        plan = []
+        for point in points:
+            delta = np.abs(point - previous)
+            duration = (delta / rate_limits).max()
+            if rate:
+                duration = max(duration, np.linalg.norm(delta) / rate)
+            if duration > 0:
+                # an axis that does not move keeps its limit rate
+                rates = np.where(delta > 0, delta / duration, rate_limits)
+                plan.append((point, rates, duration))
+            previous = point
+        return plan
+
+    def set_vector(self, setpoint, rates):
+        """Sends the ramp rate, the setpoint and the ramp to set point of the three axes together."""
+        commands = []
+        for magnet, value, rate in zip(self.magnets, setpoint, rates):
+            commands.append('SET:DEV:' + magnet.axis + ':PSU:SIG:RFST:' + f'{rate:.6f}' + '\n')
+            commands.append('SET:DEV:' + magnet.axis + ':PSU:SIG:FSET:' + f'{value:.6f}' + '\n')
+            commands.append('SET:DEV:' + magnet.axis + ':PSU:ACTN:RTOS\n')
+        if not all(self.query_many(commands)):
+            raise RuntimeWarning("No response after setting the field vector.")
+
+    def hold_vector(self):
+        """Stops the ramp of the three axes, they hold their present field."""
+        if not all(self.query_many(['SET:DEV:' + magnet.axis + ':PSU:ACTN:HOLD\n' for magnet in self.magnets])):
+            raise RuntimeWarning("No response after telling Mercury iPS to hold.")
+
+    def wait_vector(self, setpoint, tolerance=1e-4, poll_interval=0.5, timeout=None, callback=None, sleep=time.sleep):
+        """Polls the three axes in one query until the field is within tolerance of the setpoint.
+
+        :param callback: Called with the field vector after every poll
+        :param sleep: Waiting function, it returns False to stop the wait early
+        :returns bool: True when the setpoint is reached
+        """
+        start = time.perf_counter()
+        while True:
+            field = self.field_vector()
+            if callback is not None:
+                callback(field)
+            if np.abs(field - setpoint).max() <= tolerance:
+                return True
+            if timeout is not None and time.perf_counter() - start > timeout:
+                raise RuntimeError("The field vector did not reach the setpoint in time.")
+            if sleep(poll_interval) is False:
+                return False
+
+    def vector_sweep(self, points, rate=None, tolerance=1e-4, poll_interval=0.5, callback=None, sleep=time.sleep):
+        """Ramps the field vector through the points, the three axes together.
+
+        :param points: (N, 3) fields in Tesla
+        :param rate: Maximum rate of the field vector in Tesla per minute
+        :returns bool: False if the sweep was stopped by sleep, the axes then hold their field
+        """
+        for setpoint, rates, duration in self.plan_path(points, rate):
+            self.set_vector(setpoint, rates)
+            # twice the planned time before giving up
+            if not self.wait_vector(setpoint, tolerance, poll_interval, 120*duration + 60, callback, sleep):
+                self.hold_vector()
+                return False
+        return True
+
+    def circle_sweep(self, field_radius, number_points, plane='xy', rate=None):
+        """Rotates the field on a circle, the field first ramps to the starting point."""
+        return self.vector_sweep(self.circle_path(field_radius, number_points, plane), rate)
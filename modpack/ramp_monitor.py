@@ -0,0 +1,77 @@
+from time import perf_counter
+
+
+class RampMonitor:
+    """Follow a magnet ramp to its target.
+
+    The rate is measured from the readings, the rate set on the supply is
+    only the first guess. The time left is |target - field| / rate and the
+    next reading is due after POLL_FRACTION of it, between MIN_POLL and
+    MAX_POLL seconds, so the readings get denser near the target. The ramp
+    is done as soon as the field is within tolerance of the target.
+    """
+    MIN_POLL = 0.1
+    MAX_POLL = 5.0
+    POLL_FRACTION = 0.25
+
+    def __init__(self, start, target, tolerance, rate=None):
+        """
+        Args:
+            start(float): field at the start of the ramp
+            target(float): field set point
+            tolerance(float): the ramp is done when |target - field| <= tolerance
+            rate(float): expected ramp rate, in field unit per second
+        """
+        self.start = float(start)
+        self.target = float(target)
+        self.tolerance = abs(float(tolerance))
+        self.rate = abs(float(rate)) if rate else None
+        self.field = self.start
+        self.time = perf_counter()
+        self.next_time = self.time
+        self.done = self.reached(self.start)
+
+    def update(self, field, now=None):
+        """Add a reading, return True when the field is in the tolerance band"""
+        now = perf_counter() if now is None else now
+        dt = now - self.time
+        if dt > 0:
+            measured = abs(float(field) - self.field) / dt
+            if measured > 0:
+                # smooth the measured rate, the readings are quantized
+                self.rate = measured if self.rate is None else 0.5 * (self.rate + measured)
+        self.field = float(field)
+        self.time = now
+        self.done = self.reached(self.field)
+        self.next_time = now + self.nextPoll()
+        return self.done
+
+    def reached(self, field):
+        return abs(self.target - float(field)) <= self.tolerance
+
+    def eta(self):
+        """predicted time left (sec)"""
+        if self.done:
+            return 0.0
+        if not self.rate:
+            return float('inf')
+        return abs(self.target - self.field) / self.rate
+
+    def nextPoll(self):
+        """time until the next reading (sec)"""
+        return min(max(self.POLL_FRACTION * self.eta(), self.MIN_POLL), self.MAX_POLL)
+
+    def pollDue(self, now=None):
+        return (perf_counter() if now is None else now) >= self.next_time
+
+    def progress(self):
+        total = abs(self.target - self.start)
+        if total == 0:
+            return 1.0
+        return min(max(1 - abs(self.target - self.field) / total, 0.0), 1.0)
+
+    def message(self, unit='T'):
+        if self.done:
+            return f'{self.field:.5g} {unit}: target {self.target:g} {unit} reached'
+        return (f'{self.field:.5g} {unit} -> {self.target:g} {unit}  '
+                f'{self.progress():.0%}  ETA {self.eta():.0f} s')
@@ -1,10 +1,16 @@
 import numpy as np
+from time import perf_counter
 
 
 class TimeMeasurement:
+    TIME_UNIT = 0.1
+
     def __init__(self, time):
         self.time = int(time)
         self.instrument_name = 'Time Meas'
+        # start of the running sweep and the last setpoint
+        self.start = None
+        self.last_value = None
 
     def __str__(self):
         return self.instrument_name
@@ -18,16 +24,25 @@ class TimeMeasurement:
         pass
 
     def performSetValue(self, option, value, sweepRate=0.0):
-        """Perform the Set Value instrument operation"""
-        return value
+        """ return the time elapsed since the first point of the sweep (sec),
+            the setpoints only increase inside a sweep so a smaller one starts a new sweep
+        """
+        now = perf_counter()
+        if self.start is None or value <= self.last_value:
+            self.start = now
+        self.last_value = value
+        return round(now - self.start, 6)
 
     def performGetValue(self, option):
         """Perform the Get Value instrument operation"""
         pass
 
     def experimentLinspacer(self, option, target, speed, increment):
-        time = np.arange(0.1, self.time+0.1, 0.1)
-        return np.round(time, 2)
+        time = np.arange(self.TIME_UNIT, self.time+self.TIME_UNIT, self.TIME_UNIT)
+        return np.round(time, 6)
+
+    def setTimeUnit(self, time_unit):
+        self.TIME_UNIT = time_unit
 
     def setProperty(self, visa_address, instrument_name, instrument_type):
         self.instrument_name = instrument_name
@@ -0,0 +1,96 @@
+import datetime
+import numpy as np
+import pytest
+from modpack import BlueFors
+from modpack.bluefors import LogTail, LogIndex
+
+
+def write_log(folder, log_name, day, lines):
+    day_folder = folder / day
+    day_folder.mkdir(parents=True, exist_ok=True)
+    path = day_folder / f'{log_name} {day}.log'
+    with open(path, 'a', newline='') as f:
+        f.writelines(line + '\n' for line in lines)
+    return path
+
+
+@pytest.fixture
+def fridge(tmp_path):
+    bluefors = BlueFors(f'bluefors_{tmp_path.name}', tmp_path / 'logs', 1, 2, 3, 4, 5, 6, 1, 2, 5, 6,
+                        index_path=str(tmp_path / 'index'))
+    yield bluefors
+    bluefors.close()
+
+
+def test_temperature_range_skips_malformed_lines(tmp_path, fridge):
+    write_log(tmp_path / 'logs', 'CH6 T', '22-01-05', [
+        ' 05-01-22,10:00:00,1.0e-02',
+        ' 05-01-22,10:01:00,1.1e-02',
+        'garbage',
+        ' 05-01-22,10:02:00',
+        ' 05-01-22,10:03:00,1.3e-02',
+    ])
+    times, temperatures = fridge.temperature(6, datetime.datetime(2022, 1, 5, 10, 0), datetime.datetime(2022, 1, 5, 10, 3))
+    assert times.tolist() == [datetime.datetime(2022, 1, 5, 10, 0), datetime.datetime(2022, 1, 5, 10, 1),
+                              datetime.datetime(2022, 1, 5, 10, 3)]
+    np.testing.assert_allclose(temperatures, [1.0e-02, 1.1e-02, 1.3e-02])
+
+
+def test_log_tail_reads_appended_lines(tmp_path):
+    path = write_log(tmp_path, 'CH6 T', '22-01-05', [' 05-01-22,10:00:00,1.0e-02'])
+    tail = LogTail(str(path))
+    assert tail.read_lines() == ['05-01-22,10:00:00,1.0e-02']
+    assert tail.read_lines() == []
+    # a partial line is kept until its end is written
+    with open(path, 'a', newline='') as f:
+        f.write(' 05-01-22,10:01:00,1.1e-02\n 05-01-22,10:02')
+    assert tail.read_lines() == ['05-01-22,10:01:00,1.1e-02']
+    with open(path, 'a', newline='') as f:
+        f.write(':00,1.2e-02\n')
+    assert tail.read_lines() == ['05-01-22,10:02:00,1.2e-02']
+    assert tail.last_line == '05-01-22,10:02:00,1.2e-02'
+
+
+def test_log_tail_starts_at_the_end(tmp_path, monkeypatch):
+    monkeypatch.setattr(LogTail, 'TAIL_BYTES', 64)
+    lines = [f' 05-01-22,10:{minute:02d}:00,1.0e-02' for minute in range(20)]
+    path = write_log(tmp_path, 'CH6 T', '22-01-05', lines)
+    # only the complete lines of the last TAIL_BYTES bytes
+    read = LogTail(str(path)).read_lines()
+    assert 0 < len(read) < len(lines)
+    assert read == [line.strip() for line in lines[-len(read):]]
+
+
+def test_log_tail_restarts_after_truncation(tmp_path):
+    path = write_log(tmp_path, 'CH6 T', '22-01-05', [' 05-01-22,10:00:00,1.0e-02'] * 3)
+    tail = LogTail(str(path))
+    tail.read_lines()
+    with open(path, 'w', newline='') as f:
+        f.write(' 06-01-22,00:00:00,2.0e-02\n')
+    assert tail.read_lines() == ['06-01-22,00:00:00,2.0e-02']
+
+
+def test_log_index_ranges(tmp_path):
+    path = write_log(tmp_path / 'logs', 'CH6 T', '22-01-05',
+                     [f' 05-01-22,10:{minute:02d}:00,{minute}' for minute in range(10)])
+    index = LogIndex(str(path), str(tmp_path / 'index'))
+    index.update()
+    times, lines = index.lines(np.datetime64('2022-01-05T10:03:00'), np.datetime64('2022-01-05T10:05:00'))
+    assert [str(time) for time in times] == ['2022-01-05T10:03:00', '2022-01-05T10:04:00', '2022-01-05T10:05:00']
+    assert [line.split(',')[2] for line in lines] == ['3', '4', '5']
+    times, lines = index.lines(np.datetime64('2022-01-05T11:00:00'), np.datetime64('2022-01-05T12:00:00'))
+    assert len(times) == 0 and lines == []
+
+
+def test_log_index_is_saved_and_extended(tmp_path):
+    path = write_log(tmp_path / 'logs', 'CH6 T', '22-01-05', [' 05-01-22,10:00:00,0', 'garbage'])
+    index = LogIndex(str(path), str(tmp_path / 'index'))
+    index.update()
+    assert len(index.times) == 1
+    # a new index starts from the saved one and only parses the appended lines
+    write_log(tmp_path / 'logs', 'CH6 T', '22-01-05', [' 05-01-22,10:01:00,1'])
+    reloaded = LogIndex(str(path), str(tmp_path / 'index'))
+    assert reloaded.size == index.size
+    reloaded.update()
+    assert [str(time) for time in reloaded.times] == ['2022-01-05T10:00:00', '2022-01-05T10:01:00']
+    assert reloaded.size == path.stat().st_size
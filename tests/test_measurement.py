@@ -0,0 +1,96 @@
+import pytest
+from utils import MeasurementQt, SweepPlan
+from .test_sweep_plan import FakeInstrument, EmptyInstrument, info
+
+# speed (unit/h) of the ramp between two setpoints, fast enough to give no ramp point
+FAST = '1e9'
+
+
+@pytest.fixture
+def measurement():
+    """MeasurementQt reading one fake instrument, with the signals recorded"""
+    measurement = MeasurementQt()
+    reader = FakeInstrument('reader', value=2.0)
+    measurement.instruments_read = [reader]
+    measurement.options_read = ['value']
+    measurement.magnification = [1]
+    measurement.name_txt = ['control_name', 'reader']
+    measurement.method_txt = ['control_method', 'value']
+    measurement.read_groups = measurement.groupReads()
+    measurement.file_count = 0
+    measurement.line_count = 0
+    measurement.lines = []
+    measurement.blocks = []
+    measurement.signal_lines.connect(measurement.lines.append)
+    measurement.signal_block.connect(measurement.blocks.append)
+    return measurement
+
+
+def rows(measurement):
+    measurement.flushBlock()
+    return [(block.line_count, block.plot, *row) for block in measurement.blocks for row in block.data.tolist()]
+
+
+def test_every_inner_sweep_ends_a_line(measurement):
+    plan = SweepPlan([[info(FakeInstrument('a'), '1', FAST)], [info(FakeInstrument('b'), '1', FAST)]], periods=[0, 0])
+    measurement.runPlan(plan)
+    assert measurement.lines == [0, 1]
+    assert measurement.file_count == 2
+    assert rows(measurement) == [(0, False, 0.0, 2.0), (0, True, 0.0, 2.0), (0, True, 1.0, 2.0),
+                                 (1, False, 1.0, 2.0), (1, True, 0.0, 2.0), (1, True, 1.0, 2.0)]
+
+
+def test_empty_inner_sweep_ends_an_empty_line(measurement):
+    plan = SweepPlan([[info(FakeInstrument('a'), '1', FAST)], [info(EmptyInstrument('b'), '1', FAST)]], periods=[0, 0])
+    measurement.runPlan(plan)
+    assert measurement.lines == [0, 1]
+    assert measurement.file_count == 2
+    assert rows(measurement) == [(0, False, 0.0, 2.0), (1, False, 1.0, 2.0)]
+
+
+def test_skip_sweep_ends_the_line(measurement):
+    plan = SweepPlan([[info(FakeInstrument('b'), '5', FAST)]], periods=[0])
+    measurement.control.skipSweep()
+    measurement.runPlan(plan)
+    assert measurement.lines == [0]
+    assert len(rows(measurement)) == 1
+
+
+def test_map_of_a_stepped_two_level_plan(measurement):
+    plan = SweepPlan([[info(FakeInstrument('a'), '1', FAST)], [info(FakeInstrument('b'), '2', FAST)]], periods=[0, 0])
+    map_info = measurement.mapInfo(plan)
+    assert map_info['outer'].tolist() == [0, 1]
+    assert map_info['inner'].tolist() == [0, 1, 2]
+    assert map_info['channels'] == ['reader value']
+
+
+def test_no_map_for_timed_or_placeholder_axes(measurement):
+    timed = SweepPlan([[info(FakeInstrument('a'), '1', FAST)], [info(FakeInstrument('b'), '1', '3600', '0')]], periods=[0, 0])
+    assert measurement.mapInfo(timed) is None
+
+    class Placeholders(FakeInstrument):
+        def experimentLinspacer(self, option, target, speed, increment):
+            return [float(target)] + ['nan'] * 3
+
+    ramp = SweepPlan([[info(Placeholders('a'), '1', FAST)], [info(FakeInstrument('b'), '1', FAST)]], periods=[0, 0])
+    assert measurement.mapInfo(ramp) is None
+    empty = SweepPlan([[info(FakeInstrument('a'), '1', FAST)], [info(EmptyInstrument('b'), '1', FAST)]], periods=[0, 0])
+    assert measurement.mapInfo(empty) is None
+
+
+def test_repeated_continuous_sweep_ramps_back_to_its_start(measurement):
+    class Logged(FakeInstrument):
+        def performSetValue(self, option, value, sweepRate=0.0):
+            self.values.append(float(value))
+            return super().performSetValue(option, value, sweepRate)
+
+    inner = Logged('b')
+    inner.values = []
+    # 10 unit/s with a 0.01 s period: setpoints 1/9 apart
+    plan = SweepPlan([[info(FakeInstrument('a'), '1', FAST)], [info(inner, '1', '36000', '0')]], periods=[0, 0.01])
+    measurement.runPlan(plan)
+    assert inner.values[-1] == pytest.approx(1.0)
+    # the second row starts from 1, it goes back to 0 without a jump
+    assert inner.values[:10] == pytest.approx(inner.values[10:20][::-1])
+    jumps = [abs(b - a) for a, b in zip(inner.values, inner.values[1:])]
+    assert max(jumps) <= 1 / 9 + 1e-9
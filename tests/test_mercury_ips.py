@@ -0,0 +1,49 @@
+import importlib
+import numpy as np
+import pytest
+from modpack import MercuryIps
+
+Driver = importlib.import_module('drivers.Oxford_Instrument_mercruy_IPS').Driver
+
+
+def test_plan_path_uses_the_limits_of_the_magnet():
+    ips = MercuryIps(mode='ip', ip_address='127.0.0.1', field_limits={'GRPZ': 9.0}, rate_limits={'GRPZ': 0.05})
+    # the other axes keep the defaults
+    assert ips.field_limits == {'GRPX': 1.0, 'GRPY': 1.0, 'GRPZ': 9.0}
+    (setpoint, rates, duration), = ips.plan_path([[0, 0, 1.0]], start=[0, 0, 0])
+    assert duration == pytest.approx(20)
+    assert rates[2] == pytest.approx(0.05)
+    with pytest.raises(RuntimeError):
+        ips.plan_path([[0, 0, 10.0]], start=[0, 0, 0])
+
+
+@pytest.fixture
+def driver(monkeypatch):
+    driver = Driver('127.0.0.1')
+    driver.rates = []
+    monkeypatch.setattr(driver, 'field_vector', lambda: np.array([0.5, 0.0, 0.0]))
+    monkeypatch.setattr(driver, 'performGetValue', lambda option='Magnetic field', magnification=1: 0.0)
+
+    def vector_sweep(points, rate=None, **kwargs):
+        driver.rates.append(rate)
+        return True
+
+    monkeypatch.setattr(driver, 'vector_sweep', vector_sweep)
+    return driver
+
+
+def test_vector_rate_follows_the_row_speed(driver):
+    # 6 T/h
+    driver.experimentLinspacer('Magnetic field', '0.1', '6', '0')
+    driver.performSetValue('Magnetic field', 0.1)
+    # 180 degree/h on a 0.5 T circle
+    driver.experimentLinspacer('Field angle XY', '10', '180', '0')
+    driver.performSetValue('Field angle XY', 1)
+    # sweepRate (T/min) overrides the row speed
+    driver.performSetValue('Magnetic field', 0.1, sweepRate=0.02)
+    assert driver.rates == pytest.approx([0.1, 0.5 * np.pi / 60, 0.02])
+
+
+def test_vector_rate_without_a_speed(driver):
+    driver.performSetValue('Magnetic field', 0.1)
+    assert driver.rates == [Driver.VECTOR_RATE]
@@ -0,0 +1,111 @@
+import socketserver
+import threading
+import time
+import pytest
+from modpack.mercuryips_GPIB import TcpTransport
+
+
+class FakeMercury(socketserver.ThreadingTCPServer):
+    """ Answers every line 'X' with 'STAT:X:VALID'.
+
+        batch: lines received before the first answer, a client waiting
+        for each answer before sending the next command never gets one
+        chunk: the answers are sent by pieces of this many bytes
+        lines_per_connection: the connection is closed after this many answers
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, batch=1, chunk=None, lines_per_connection=None):
+        super().__init__(('127.0.0.1', 0), FakeMercuryHandler)
+        self.batch = batch
+        self.chunk = chunk
+        self.lines_per_connection = lines_per_connection
+        self.connections = 0
+        self.received = []
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+
+class FakeMercuryHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        server = self.server
+        server.connections += 1
+        answered = 0
+        pending = []
+        for line in self.rfile:
+            command = line.decode().strip()
+            server.received.append(command)
+            pending.append(command)
+            if len(pending) < server.batch:
+                continue
+            for command in pending:
+                self.send(f'STAT:{command}:VALID\n'.encode())
+                answered += 1
+                if server.lines_per_connection is not None and answered >= server.lines_per_connection:
+                    return
+            pending = []
+
+    def send(self, data):
+        if self.server.chunk is None:
+            self.wfile.write(data)
+            return
+        for n in range(0, len(data), self.server.chunk):
+            self.wfile.write(data[n:n + self.server.chunk])
+            self.wfile.flush()
+            time.sleep(0.001)
+
+
+@pytest.fixture
+def fake_mercury(request):
+    servers = []
+
+    def start(**kwargs):
+        server = FakeMercury(**kwargs)
+        threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True).start()
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def test_query_many_is_pipelined(fake_mercury):
+    # no answer before the three commands are received
+    server = fake_mercury(batch=3)
+    transport = TcpTransport('127.0.0.1', server.port, timeout=2.0)
+    try:
+        commands = ['READ:DEV:GRPX:PSU:SIG:FLD', 'READ:DEV:GRPY:PSU:SIG:FLD', 'READ:DEV:GRPZ:PSU:SIG:FLD']
+        assert transport.query_many(commands) == [f'STAT:{command}:VALID\n' for command in commands]
+        assert server.connections == 1
+    finally:
+        transport.close()
+
+
+def test_lines_split_across_chunks(fake_mercury):
+    server = fake_mercury(chunk=3)
+    transport = TcpTransport('127.0.0.1', server.port, timeout=2.0)
+    try:
+        assert transport.query_many(['A', 'B']) == ['STAT:A:VALID\n', 'STAT:B:VALID\n']
+        assert transport.query('C\n') == 'STAT:C:VALID\n'
+        assert transport.buffer == b''
+    finally:
+        transport.close()
+
+
+def test_reconnect_after_peer_closes(fake_mercury):
+    server = fake_mercury(lines_per_connection=1)
+    transport = TcpTransport('127.0.0.1', server.port, timeout=2.0)
+    try:
+        assert transport.query('A') == 'STAT:A:VALID\n'
+        # the server closed the connection, the command is sent again on a new one
+        assert transport.query('B') == 'STAT:B:VALID\n'
+        assert server.connections == 2
+        assert server.received[-1] == 'B'
+    finally:
+        transport.close()
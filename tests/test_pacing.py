@@ -0,0 +1,73 @@
+import pytest
+from utils.pacing import Pacer
+
+
+class Clock:
+    """perf_counter and sleep of utils.pacing, sleep moves the time"""
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def perf_counter(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr('utils.pacing.perf_counter', clock.perf_counter)
+    monkeypatch.setattr('utils.pacing.sleep', clock.sleep)
+    return clock
+
+
+def point(pacer, clock, work):
+    pacer.begin()
+    clock.now += work
+    return pacer.wait()
+
+
+def test_deadlines_are_absolute(clock):
+    pacer = Pacer(1.0)
+    for work in (0.3, 0.5, 0.9):
+        assert point(pacer, clock, work)
+    # the work does not add up, point k ends at k * period
+    assert clock.sleeps == pytest.approx([0.7, 0.5, 0.1])
+    assert clock.now == pytest.approx(3.0)
+    assert pacer.report() == ''
+
+
+def test_overrun_reanchors_the_schedule(clock):
+    pacer = Pacer(1.0)
+    point(pacer, clock, 0.2)
+    # 0.5 s late, no sleep and the next point is one period after now
+    point(pacer, clock, 1.5)
+    assert clock.now == pytest.approx(2.5)
+    point(pacer, clock, 0.2)
+    assert clock.now == pytest.approx(3.5)
+    assert clock.sleeps == pytest.approx([0.8, 0.8])
+    assert pacer.report() == '1 of 3 points overran the 1 s period (worst 500 ms)'
+    # the report starts again from zero
+    assert pacer.report() == ''
+
+
+def test_reset_starts_a_new_schedule(clock):
+    pacer = Pacer(1.0)
+    point(pacer, clock, 0.2)
+    clock.now += 10
+    pacer.reset()
+    point(pacer, clock, 0.2)
+    assert clock.sleeps == pytest.approx([0.8, 0.8])
+    assert pacer.report() == ''
+
+
+def test_zero_period_never_sleeps(clock):
+    pacer = Pacer(0)
+    for work in (0.3, 2.0):
+        assert point(pacer, clock, work)
+    assert clock.sleeps == []
+    assert pacer.report() == ''
@@ -0,0 +1,93 @@
+import threading
+from time import perf_counter, sleep
+from utils.run_control import RunControl
+
+# a request must wake the worker well before the end of its wait
+LATENCY = 0.2
+
+
+def later(delay, function):
+    timer = threading.Timer(delay, function)
+    timer.start()
+    return timer
+
+
+def test_sleep_runs_to_the_end():
+    control = RunControl()
+    start = perf_counter()
+    assert control.sleep(0.05)
+    assert perf_counter() - start >= 0.05
+
+
+def test_abort_wakes_sleep():
+    control = RunControl()
+    later(0.05, control.abort)
+    start = perf_counter()
+    assert not control.sleep(10)
+    assert perf_counter() - start < LATENCY
+    assert control.aborted
+    assert not control.checkpoint()
+
+
+def test_skip_wakes_only_skippable_sleep():
+    control = RunControl()
+    later(0.05, control.skipSweep)
+    start = perf_counter()
+    assert not control.sleep(10, skippable=True)
+    assert perf_counter() - start < LATENCY
+    # a wait outside the innermost sweep is not skipped
+    assert control.sleep(0.01)
+    assert control.consumeSkipSweep()
+    assert not control.consumeSkipSweep()
+
+
+def test_quit_loop_is_consumed():
+    control = RunControl()
+    control.quitLoop()
+    assert not control.sleep(10)
+    assert control.consumeQuitLoop()
+    assert control.sleep(0)
+    assert not control.aborted
+
+
+def test_pause_blocks_checkpoint_until_resume():
+    control = RunControl()
+    control.pause()
+    later(0.1, control.resume)
+    start = perf_counter()
+    assert control.checkpoint()
+    waited = perf_counter() - start
+    assert 0.1 <= waited < 0.1 + LATENCY
+    assert control.paused_time >= 0.1
+
+
+def test_pause_is_not_counted_in_sleep():
+    control = RunControl()
+    later(0.02, control.pause)
+    later(0.2, control.resume)
+    start = perf_counter()
+    assert control.sleep(0.1)
+    # 0.02 s before the pause, 0.08 s after it
+    assert perf_counter() - start >= 0.28
+
+
+def test_abort_wakes_pause():
+    control = RunControl()
+    control.pause()
+    later(0.05, control.abort)
+    start = perf_counter()
+    assert not control.checkpoint()
+    assert perf_counter() - start < LATENCY
+
+
+def test_toggle_pause():
+    control = RunControl()
+    control.togglePause()
+    assert control.paused
+    sleep(0.01)
+    control.togglePause()
+    assert not control.paused
+    paused_time = control.paused_time
+    assert paused_time >= 0.01
+    sleep(0.01)
+    assert control.paused_time == paused_time
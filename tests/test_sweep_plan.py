@@ -0,0 +1,122 @@
+import numpy as np
+from utils import DriverInterface, SweepPlan
+from modpack import TimeMeasurement
+
+
+class FakeInstrument(DriverInterface):
+    """Instrument that holds the last value set"""
+
+    def __init__(self, name, value=0.0):
+        self.setProperty('', name, 'fake')
+        self.value = value
+
+    def performOpen(self):
+        pass
+
+    def performClose(self):
+        pass
+
+    def performSetValue(self, option, value, sweepRate=0.0):
+        self.value = float(value)
+        return self.value
+
+    def performGetValue(self, option='0', magnification=1):
+        return self.value * magnification
+
+
+class EmptyInstrument(FakeInstrument):
+    """Instrument whose sweep has no setpoint"""
+
+    def experimentLinspacer(self, option, target, speed, increment):
+        return []
+
+
+def info(instrument, target, speed='1', increment='1', check='1'):
+    """ [instrument, method, check, target, speed, increment] of a tree row """
+    return [instrument, 'value', check, target, speed, increment]
+
+
+def walk(plan, skip_at=()):
+    """ (level, name, value) of the steps, True is sent at the steps in skip_at """
+    visited = []
+    steps = plan.steps()
+    step = next(steps, None)
+    while step is not None:
+        key = (step.level, str(step.instrument[0]), step.value)
+        visited.append(key)
+        try:
+            step = steps.send(key in skip_at)
+        except StopIteration:
+            step = None
+    return visited
+
+
+def test_steps_depth_first():
+    plan = SweepPlan([[info(FakeInstrument('a'), '1'), info(FakeInstrument('c'), '1')],
+                      [info(FakeInstrument('b'), '2')]], periods=[0, 0])
+    assert plan.bottom == 1
+    inner = [(1, 'b', 0), (1, 'b', 1), (1, 'b', 2)]
+    assert walk(plan) == ([(0, 'a', 0)] + inner + [(0, 'a', 1)] + inner +
+                          [(0, 'c', 0)] + inner + [(0, 'c', 1)] + inner)
+
+
+def test_send_skip_ends_the_sweep():
+    plan = SweepPlan([[info(FakeInstrument('a'), '1')], [info(FakeInstrument('b'), '2')]], periods=[0, 0])
+    # skipping the inner sweep goes on with the next outer point,
+    # skipping the outer sweep ends the tree
+    assert walk(plan, skip_at={(1, 'b', 1), (0, 'a', 1)}) == [
+        (0, 'a', 0), (1, 'b', 0), (1, 'b', 1), (0, 'a', 1)]
+
+
+def test_empty_levels_are_dropped():
+    plan = SweepPlan([[info(FakeInstrument('a'), '1')], [], []], periods=[0])
+    assert len(plan) == 1
+    assert plan.periods == [0]
+
+
+def test_empty_sweep_gives_one_step():
+    plan = SweepPlan([[info(FakeInstrument('a'), '1')], [info(EmptyInstrument('b'), '2')]], periods=[0, 0])
+    steps = list(plan.steps())
+    assert [(step.level, step.value, step.length) for step in steps] == [
+        (0, 0, 2), (1, None, 0), (0, 1, 2), (1, None, 0)]
+
+
+def test_timed_level_keeps_sample_period():
+    # 3600 units/h = 1 unit/s, a speed sweep of 1 unit must last 1 s
+    plan = SweepPlan([[info(FakeInstrument('a'), '1', speed='3600', increment='0')]], periods=[0])
+    assert plan.periods == [SweepPlan.SAMPLE_PERIOD]
+    assert len(plan.setpoints[0][0]) == round(1 / SweepPlan.SAMPLE_PERIOD)
+
+
+def test_stepped_level_keeps_zero_period():
+    plan = SweepPlan([[info(FakeInstrument('a'), '3')]], periods=[0])
+    assert plan.periods == [0]
+    np.testing.assert_allclose(plan.setpoints[0][0], [0, 1, 2, 3])
+
+
+def test_time_meas_level_keeps_sample_period():
+    timer = TimeMeasurement('1')
+    plan = SweepPlan([[[timer, '-', '1', '1', '-', '-']]], periods=[0])
+    assert plan.periods == [SweepPlan.SAMPLE_PERIOD]
+    assert timer.TIME_UNIT == SweepPlan.SAMPLE_PERIOD
+
+
+def test_time_meas_records_elapsed_time(monkeypatch):
+    clock = iter([10.0, 10.5, 12.0, 20.0, 20.25])
+    monkeypatch.setattr('modpack.time_measurement.perf_counter', lambda: next(clock))
+    timer = TimeMeasurement('1')
+    values = [timer.performSetValue('-', value) for value in (0.1, 0.2, 0.3)]
+    # the nominal setpoints are not recorded, the real time since the first point is
+    assert values == [0.0, 0.5, 2.0]
+    # the sweep starts again from its first setpoint
+    assert [timer.performSetValue('-', value) for value in (0.1, 0.2)] == [0.0, 0.25]
+
+
+def test_time_unit_is_set_only_for_timed_levels():
+    stepped, timed = FakeInstrument('a'), FakeInstrument('b')
+    SweepPlan([[info(stepped, '1')], [info(timed, '1', speed='3600', increment='0')]], periods=[10, 0.5])
+    assert stepped.TIME_UNIT == DriverInterface.TIME_UNIT
+    assert timed.TIME_UNIT == 0.5
+    # a later tree where the instrument is stepped gets the default back
+    SweepPlan([[info(timed, '1')]], periods=[10])
+    assert timed.TIME_UNIT == DriverInterface.TIME_UNIT
@@ -0,0 +1,77 @@
+import io
+import pytest
+from utils import TxtFunction
+
+
+def write_csv(path, lines):
+    with open(path, 'w', newline='') as f:
+        f.writelines(line + '\r\n' for line in lines)
+    return str(path)
+
+
+def test_side_by_side_pads_the_short_files(tmp_path):
+    names = [
+        write_csv(tmp_path / '0.csv', ['x,y', 'V,A', '1,2', '3,4']),
+        write_csv(tmp_path / '1.csv', ['x,y,z', 'V,A,K']),
+        # no file, and a file without a title: both left out
+        str(tmp_path / 'missing.csv'),
+        write_csv(tmp_path / '2.csv', []),
+        write_csv(tmp_path / '3.csv', ['t', 's', '5']),
+    ]
+    output = io.StringIO(newline='')
+    TxtFunction.txtSideBySide(names, output)
+    assert output.getvalue().split('\r\n') == [
+        'x,y,x,y,z,t',
+        'V,A,V,A,K,s',
+        '1,2,,,,5',
+        '3,4,,,,',
+        '',
+    ]
+
+
+def test_side_by_side_without_files(tmp_path):
+    output = io.StringIO(newline='')
+    TxtFunction.txtSideBySide([str(tmp_path / 'missing.csv')], output)
+    assert output.getvalue() == ''
+
+
+@pytest.fixture
+def txt(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'data').mkdir()
+    monkeypatch.setattr(TxtFunction, 'MERGE_GROUP', 2)
+    txt = TxtFunction()
+    txt.setUnits(['A'])
+    return txt
+
+
+def test_merger_streams_the_merged_groups(tmp_path, txt):
+    for n in range(3):
+        write_csv(tmp_path / 'data' / f'{n}.csv', ['x,y', f'{n},{n}0'])
+    # the sequences 0 and 1 are complete once 2 is opened
+    txt.mergeGroups(2)
+    txt.txtMerger(str(tmp_path / 'out'), 2, 2)
+    with open(tmp_path / 'out.csv', newline='') as f:
+        assert f.read().split('\r\n') == [
+            '<CHA>,S1C1,<CHA>,S2C1,<CHA>,S3C1',
+            ',A,,A,,A',
+            'x,y,x,y,x,y',
+            '0,00,1,10,2,20',
+            '',
+        ]
+
+
+def test_merger_fails_on_a_failed_group(tmp_path, txt):
+    def fail(names, output_name):
+        raise OSError('disk full')
+
+    txt.txtMergeGroup = fail
+    for n in range(3):
+        write_csv(tmp_path / 'data' / f'{n}.csv', ['x,y', f'{n},{n}0'])
+    txt.mergeGroups(2)
+    with pytest.raises(OSError):
+        txt.txtMerger(str(tmp_path / 'out'), 2, 2)
+    assert not (tmp_path / 'out.csv').exists()
+    # the next run starts clean
+    txt.txtDeleter()
+    assert txt.merge_jobs == [] and txt.merged_groups == 0
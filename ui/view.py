@@ -1,11 +1,11 @@
 #!/usr/bin/env python
 from PyQt5 import sip
-from PyQt5.QtGui import QIcon, QColor
-from PyQt5.QtCore import Qt, pyqtSlot
-from PyQt5.QtWidgets import QMessageBox, QFileDialog, QTreeWidgetItem, QTreeWidgetItemIterator, QMainWindow, QTableWidgetItem, QDialog
+from PyQt5.QtGui import QIcon, QColor, QTransform
+from PyQt5.QtCore import Qt, pyqtSlot, QTimer
+from PyQt5.QtWidgets import QMessageBox, QFileDialog, QTreeWidgetItem, QTreeWidgetItemIterator, QMainWindow, QTableWidgetItem, QDialog, QAction, QInputDialog, QComboBox, QVBoxLayout
 from ui import Qt_Window, Control_Window, Read_Window
 from time import sleep
-from utils import load_drivers, addtwodimdict, colorLoop, is_number
+from utils import load_drivers, colorLoop, is_number, LineBuffer, SavedLines
 from nidaqmx.system import System
 import pyqtgraph as pg
 import pyqtgraph.exporters
@@ -19,6 +19,8 @@ import numpy as np
 class MainWindow(QMainWindow):
     """Main class"""
     RECENT_PATH = './ui/asset/step.txt'
+    MAX_LEVEL = 6
+    FRAME_RATE = 30  # redraws per second of the live plot
     
     def __init__(self):
         super(MainWindow, self).__init__()
@@ -28,10 +30,13 @@ class MainWindow(QMainWindow):
         # control panel & read panel
         self.control_panel = ControlPanel()
         self.read_panel = ReadlPanel()
+        # live 2D map of two-level sweeps
+        self.map_window = MapWindow()
 
         # Pre-run functions
         self._intrumentList()
         self._visaList()
+        self._setOptionActions()
         self._connectSignals()
         self._setPlotWidget()
         self._initParameters()
@@ -68,6 +73,20 @@ class MainWindow(QMainWindow):
         self.ui.listWidget_2.clear()
         self.ui.listWidget_2.addItems(self.driver_list.keys())
 
+    def _setOptionActions(self):
+        """Measurement options in the Options menu"""
+        self.ui.actionParallelRead = QAction('Parallel read', self, checkable=True)
+        self.ui.actionParallelRead.setToolTip('Read instruments on different connections at the same time')
+        self.ui.menuQuit.insertAction(self.ui.actionQuit, self.ui.actionParallelRead)
+        self.ui.actionSamplePeriod = QAction('Sample period...', self)
+        self.ui.actionSamplePeriod.triggered.connect(self.setSamplePeriods)
+        self.ui.menuQuit.insertAction(self.ui.actionQuit, self.ui.actionSamplePeriod)
+        self.ui.actionMap = QAction('2D map', self)
+        self.ui.actionMap.setToolTip('Color map of a two-level sweep, filled line by line')
+        self.ui.actionMap.triggered.connect(self.map_window.show)
+        self.ui.menuQuit.insertAction(self.ui.actionQuit, self.ui.actionMap)
+        self.ui.menuQuit.insertSeparator(self.ui.actionQuit)
+
     def _connectSignals(self):
         """Connect buttons with functions"""
         # Page 1 Buttons
@@ -120,6 +139,11 @@ class MainWindow(QMainWindow):
         self.plt.setLabel('bottom', '   ')
         self.plt.setLabel('left', '   ')
         self.plt.setDownsampling(auto=True, mode='peak')
+        # the live lines are redrawn once per frame, whatever the acquisition rate
+        self.redraw_timer = QTimer(self)
+        self.redraw_timer.timeout.connect(self.redrawLines)
+        self.redraw_timer.timeout.connect(self.drawReadout)
+        self.redraw_timer.start(1000 // self.FRAME_RATE)
 
     def _defaultPosition(self):
         if os.path.exists(self.RECENT_PATH):
@@ -138,6 +162,7 @@ class MainWindow(QMainWindow):
         self.read_row_count = 1
         self.save_plot_count = 0
         self.time_unit = 0.1  # sec
+        self.sample_periods = []  # sec per level, empty = time_unit
         self.progress = 0
         self.load = True
         self.open_folder = os.getcwd()
@@ -150,14 +175,20 @@ class MainWindow(QMainWindow):
 
         # PlotItem lines
         self.data_line = []
-        self.x_data = []
-        self.y_data = []
+        self.line_buffer = None
+        self.saved_lines = SavedLines(0)
+        self.saved_items = {}
+        self.dirty_lines = set()
+        self.pens = []
+        # latest (x, name, method, y_show) waiting for the next frame
+        self.readout = None
         self.color_offset = 0
 
         # choose line
         self.choose_line_start = 0
         self.choose_line_space = 1
         self.choose_line_num = 0
+        self.choose_line = set()
         self.line_num_now = 0
 
     # =============================================================================
@@ -173,10 +204,9 @@ class MainWindow(QMainWindow):
             steps[0].append(".")
         # 1 Control:
         iterator = QTreeWidgetItemIterator(self.tree)
-        level = {'0': '-', '1': '--', '2': '---' }
         while iterator.value():
             item = iterator.value()
-            steps[1].append(level[item.text(0)])
+            steps[1].append('-' * (int(item.text(0)) + 1))
             for i in range(1,8):
                 steps[1].append(item.text(i))
             steps[1].append(".")
@@ -212,6 +242,8 @@ class MainWindow(QMainWindow):
                     'Control (Level/Name/Type/Property/Target/Speed/Increment/Ins_lable) :' : 1,
                     'Read (Name/Type/Property/Magnification/Unit) :' : 2,
                     'File address:' : 3, 'File name:' : 4, 'Created on' : -1    }
+        # the last item added on each level, parent of the next deeper level
+        tree_path = []
         try:
             for step in steps:
                 info = step.rstrip().split('\t')
@@ -224,21 +256,19 @@ class MainWindow(QMainWindow):
                     sleep(0.5)
                 # Control:
                 elif mode == 1:
-                    if info[0] == '-':
+                    depth = len(info[0]) - 1
+                    if depth == 0:
                         if info[1] == 'Time Meas':
                             self.timeAddLevel(info[4])
                         else:
                             self.addLevel(info[1:])
-                    elif info[0] == '--':
-                        if info[1] == 'Time Meas':
-                            self.timeAddChild(info[4], self.root)
-                        else:
-                            self.chooseAddChild(info[1:], self.root)
-                    elif info[0] == '---':
+                        tree_path = [self.root]
+                    else:
                         if info[1] == 'Time Meas':
-                            self.timeAddChild(info[4], self.child1)
+                            self.timeAddChild(info[4], tree_path[depth-1])
                         else:
-                            self.chooseAddChild(info[1:], self.child1)
+                            self.chooseAddChild(info[1:], tree_path[depth-1])
+                        tree_path = tree_path[:depth] + [self.child1]
                 # Read:
                 elif mode == 2:
                     if len(info)==4:
@@ -419,9 +449,9 @@ class MainWindow(QMainWindow):
         if wait_time=="":
             wait_time = self.ui.lineEdit_5.text()
             item = self.tree.currentItem()
-        # Check if the # of childs has reached 2 (Maximum value)            
-        if item.text(0) == '2':
-            self.pageTwoInformation("Time measurement - Can't join more childs in new layer. The Maximum layers is 3.")
+        # Check if the # of childs has reached the maximum value
+        if int(item.text(0)) >= self.MAX_LEVEL - 1:
+            self.pageTwoInformation(f"Time measurement - Can't join more childs in new layer. The Maximum layers is {self.MAX_LEVEL}.")
             return
         if is_number(wait_time):
             self.child1 = QTreeWidgetItem(item)
@@ -473,9 +503,9 @@ class MainWindow(QMainWindow):
             control_list = self.getControlList()
             # QTreeWidgetItem括號內放的物件是作為基礎(root)，child會往下一層放
             item = self.tree.currentItem()
-        # Check if the # of childs has reached 2 (Maximum value)
-        if item.text(0) == '2':
-            self.pageTwoInformation("Control - Can't join more childs in new layer. The Maximum layers is 3.")
+        # Check if the # of childs has reached the maximum value
+        if int(item.text(0)) >= self.MAX_LEVEL - 1:
+            self.pageTwoInformation(f"Control - Can't join more childs in new layer. The Maximum layers is {self.MAX_LEVEL}.")
             return 
         # Check if the current item is the father (value >= 0)
         if self.tree.indexOfTopLevelItem(item) >= 0:
@@ -527,6 +557,21 @@ class MainWindow(QMainWindow):
         # show the method of the chosen itesm to the list
         self.ui.listWidget_3.addItems(instrument.METHOD)
 
+    def setSamplePeriods(self):
+        """ Ask the sample period of each level, e.g. '1, 0.02' """
+        text = ', '.join(f'{period:g}' for period in self.sample_periods)
+        text, ok = QInputDialog.getText(self, 'Sample period',
+                                        'Sample period of each level in sec, separated by commas\n'
+                                        '(0 = as fast as possible, empty = 0.1 s):', text=text)
+        if not ok:
+            return
+        periods = [period.strip() for period in text.split(',') if period.strip()]
+        if all(is_number(period) and float(period) >= 0 for period in periods):
+            self.sample_periods = [float(period) for period in periods]
+            self.pageTwoInformation(f'Sample period: {text if periods else "default"}')
+        else:
+            self.pageTwoInformation('Sample period - Please enter numbers >= 0.')
+
     def checkFunctionIncrement(self):
         if self.control_panel.read_ui.checkBox.isChecked():
             self.control_panel.read_ui.lineEdit_5.setEnabled(True)
@@ -653,6 +698,7 @@ class MainWindow(QMainWindow):
 
     def plotSave(self):
         """ save figure from page3 """
+        self.redrawLines()
         exporter = pyqtgraph.exporters.ImageExporter(self.plt.scene())
         exporter.export(self.folder_address + '/%s_%d.png' % (self.ui.lineEdit_2.text(), self.save_plot_count))
         QMessageBox.information(self, "Done.", "The figure No.%d has been saved." % self.save_plot_count)
@@ -737,53 +783,80 @@ class MainWindow(QMainWindow):
         """
         self.plt.clear()
         self.read_len = len(self.instruments_read)
-        # one line data
-        self.x_data = np.array([], dtype=np.float32)
-        self.y_data = []
-        # all plot Item
-        self.saved_data = {}
+        # one line data [x, y1, y2, ...]
+        self.line_buffer = LineBuffer(self.read_len + 1)
+        # all saved lines and their PlotItems {(chunk, channel, color): PlotDataItem}
+        self.saved_lines = SavedLines(self.read_len)
+        self.saved_items = {}
         # plot item
         self.data_line = []
         # line display switch
         self.switch_list = []
         # color
         self.color = []
+        self.pens = []
+        self.dirty_lines = set()
 
         for i in range(self.read_len):
-            self.data_line.append(self.ui.graphWidget.plot([]))
-            self.y_data.append(np.array([], dtype=np.float32))
             self.switch_list.append(True)
             self.color.append(colorLoop(i+self.color_offset))
-            
-    def plotUpdate(self, n, x, y_n, line_id):
-        if not np.isnan(x):
-            if n == 0:
-                self.x_data = np.append(self.x_data, [x])
-            self.y_data[n] = np.append(self.y_data[n], y_n)
+            self.pens.append(pg.mkPen(self.color[i], width=1))
+            self.data_line.append(self.ui.graphWidget.plot([], pen=self.pens[i]))
+
+    def plotUpdate(self, block):
+        """ add the rows of a DataBlock of the innermost sweep to the lines """
+        if not block.plot:
+            return
+        rows = ~np.isnan(block.x)
+        if not rows.any():
+            return
+        line_id = block.line_count
+        self.line_buffer.append(block.data[rows])
+        for n in range(self.read_len):
             # setData to the PlotItems
             # TODO: The three line selection functions currently only include the second one
             if not self.switch_list[n] or (self.choose_line_num!=0 and not line_id in self.choose_line):
                 pass
             else:
-                self.data_line[n].setData(self.x_data, self.y_data[n], pen=pg.mkPen(self.color[n], width=1))
+                self.dirty_lines.add(n)
+
+    def redrawLines(self):
+        """ push the lines changed since the last frame to their PlotItems """
+        for n in self.dirty_lines:
+            self.data_line[n].setData(self.line_buffer.x, self.line_buffer.y(n))
+        self.dirty_lines = set()
 
     def saveLines(self, file_count):
+        self.redrawLines()
+        # the saved lines keep the filled buffer, the live line starts again with the same capacity
+        data = self.line_buffer.detach()
+        visible = self.choose_line_num == 0 or file_count in self.choose_line
+        chunk = self.saved_lines.add(file_count, data, self.color, visible)
         for i in range(self.read_len):       
-            line = self.ui.graphWidget.plot(self.x_data, self.y_data[i], pen=pg.mkPen(self.color[i], width=1))
-            addtwodimdict(self.saved_data, file_count, i, line)
+            self.drawSaved(chunk, i, self.color[i])
             self.color_offset += 3
             self.color[i] = colorLoop(i+self.color_offset)
+            self.pens[i] = pg.mkPen(self.color[i], width=1)
+            self.data_line[i].setPen(self.pens[i])
             if self.switch_list[i]:
                 self.ui.tableWidget_5.item(0,i+1).setForeground(QColor(self.color[i][0], self.color[i][1], self.color[i][2]))
-            if not self.switch_list[i] or (self.choose_line_num!=0 and not file_count in self.choose_line):
-                line.hide()
             self.line_num_now = file_count
-        
-        # initialize x y data
-        self.x_data = np.array([], dtype=np.float32)
-        self.y_data = []
-        for _ in range(self.read_len):
-            self.y_data.append(np.array([], dtype=np.float32))
+        self.map_window.addRow(file_count, data)
+
+    def drawSaved(self, chunk, channel, color):
+        """ redraw the selected lines of one chunk, channel and color with a single PlotItem """
+        key = (chunk, channel, tuple(color))
+        if key not in self.saved_items:
+            self.saved_items[key] = self.ui.graphWidget.plot([], pen=pg.mkPen(color, width=1))
+        x, y, connect = self.saved_lines.curve(chunk, channel, color)
+        self.saved_items[key].setData(x, y, connect=connect)
+        self.saved_items[key].setVisible(self.switch_list[channel])
+
+    def mapUpdate(self, info):
+        """ a new tree starts, info is the geometry of its 2D map or None """
+        self.map_window.setMap(info)
+        if info is not None:
+            self.pageThreeInformation('2D map available in Options > 2D map')
 
     def lineDisplaySwitch(self):
         """ this function is connected to tableWidget_5 on page 3
@@ -798,20 +871,17 @@ class MainWindow(QMainWindow):
         else:
             self.switch_list[col] = True
             self.ui.tableWidget_5.item(0,col+1).setForeground(QColor(self.color[col][0], self.color[col][1], self.color[col][2]))
-        self.renewGraph()
+        self.switchChannel(col)
 
-    def renewGraph(self):
-        # hide all line in graph
-        for group in self.saved_data.values():
-            for line in group.values():
-                line.hide()
-
-        for id, line in enumerate(self.data_line):
-            if self.switch_list[id]:
-                line.show()
-            else:
-                line.hide()
+    def switchChannel(self, channel):
+        """ show or hide the live and saved lines of one channel, the line selection is unchanged """
+        self.data_line[channel].setVisible(self.switch_list[channel])
+        for key, item in self.saved_items.items():
+            if key[1] == channel:
+                item.setVisible(self.switch_list[channel])
 
+    def renewGraph(self):
+        """ apply the line selection of spinBox (start), spinBox_2 (number) and spinBox_3 (step) """
         # get choose_line_num
         self.choose_line_num = self.ui.spinBox_2.value()
         if self.choose_line_num == 0:
@@ -824,41 +894,50 @@ class MainWindow(QMainWindow):
         start = self.choose_line_start*self.choose_line_space
         end = start+self.choose_line_space*(int(choose_line_num/self.choose_line_space)-self.choose_line_start)
         if end > start:
-            choose_line = np.linspace(start, end, display_line_num, dtype=np.int16)
+            choose_line = np.linspace(start, end, display_line_num, dtype=np.int64)
         else:
-            choose_line = np.array([])
-        self.choose_line = set(choose_line)
-        print(self.choose_line)
+            choose_line = np.array([], dtype=np.int64)
+        self.choose_line = set(choose_line.tolist())
 
-        if self.saved_data:
-            try:
-                self.rePlotData(choose_line)      
-            except KeyError:
-                logging.exception("renewGraph error")
+        if len(self.saved_lines):
+            self.rePlotData(choose_line)
 
     def rePlotData(self, choose_line):
-        for curve_group in choose_line:
-            for curve_num in self.saved_data[curve_group].keys():
-                if self.switch_list[curve_num]:                    
-                    self.saved_data[curve_group][curve_num].show()
+        """ apply the selection as an index mask, only the chunks where it changed are redrawn """
+        chunks = self.saved_lines.setVisible(choose_line)
+        for chunk, channel, color in [key for key in self.saved_items if key[0] in chunks]:
+            self.drawSaved(chunk, channel, color)
 
                     
     # =============================================================================
     # axis setting
     # =============================================================================
 
-    def axisUpdate(self, x_show, y_show):
-        # update x title (instrument name and method)
-        # insturement name
-        self.ui.tableWidget_5.setItem(0, 0, QTableWidgetItem(f'{x_show[1]}'))
-        # method
-        self.ui.tableWidget_5.setItem(1, 0, QTableWidgetItem(f'{x_show[2]}'))
+    def axisUpdate(self, block):
+        """ keep the last row of the block, the table is updated by drawReadout once per frame """
+        self.readout = (block.x[-1], block.name_txt[0], block.method_txt[0], block.y[-1])
 
+    def drawReadout(self):
+        if self.readout is None:
+            return
+        x_show, name, method, y_show = self.readout
+        self.readout = None
+        # update x title (instrument name and method)
+        self.setReadoutText(0, 0, f'{name}')
+        self.setReadoutText(1, 0, f'{method}')
         # update x value
-        self.ui.tableWidget_5.setItem(2, 0, QTableWidgetItem(f'{x_show[0]:g}'))
+        self.setReadoutText(2, 0, f'{x_show:g}')
         # update y value
         for i in range(self.read_len):
-            self.ui.tableWidget_5.setItem(2, (i + 1), QTableWidgetItem(f'{y_show[i]:g}'))
+            self.setReadoutText(2, i + 1, f'{y_show[i]:g}')
+
+    def setReadoutText(self, row, column, text):
+        """ the items of tableWidget_5 are created once and then only their text changes """
+        item = self.ui.tableWidget_5.item(row, column)
+        if item is None:
+            self.ui.tableWidget_5.setItem(row, column, QTableWidgetItem(text))
+        elif item.text() != text:
+            item.setText(text)
 
     # =============================================================================
     # Other
@@ -875,6 +954,10 @@ class MainWindow(QMainWindow):
         self.ui.textBrowser_3.clear
         self.ui.textBrowser_3.append(str(string))
 
+    def statusInformation(self, string):
+        """instrument status (ramp progress, ...) in the status bar, only the last one is shown"""
+        self.ui.statusbar.showMessage(str(string))
+
     def switchToPlotTab(self, page):
         self.ui.tabWidget.setCurrentIndex(page)
 
@@ -900,3 +983,107 @@ class ReadlPanel(QDialog):
         self.ctr_ui.setupUi(self)
         self.ctr_ui.pushButton_5.clicked.connect(self.close)
         self.ctr_ui.pushButton_6.clicked.connect(self.close)
+
+
+class MapWindow(QDialog):
+    """ Page 3 live color map of a two-level sweep
+
+        data[channel, outer index, inner index] is allocated when the tree
+        starts, every inner sweep fills one row and the single ImageItem is
+        updated once per row. The two movable lines select the row and the
+        column shown in the line cuts below the map.
+    """
+
+    def __init__(self):
+        super(MapWindow, self).__init__()
+        self.setWindowTitle('2D map')
+        self.resize(700, 800)
+        self.data = None
+        self.info = None
+        # read channel selection
+        self.channel = QComboBox()
+        self.channel.currentIndexChanged.connect(self.drawMap)
+        self.graph = pg.GraphicsLayoutWidget()
+        layout = QVBoxLayout(self)
+        layout.addWidget(self.channel)
+        layout.addWidget(self.graph)
+        # map
+        self.map_plot = self.graph.addPlot(row=0, col=0)
+        self.image = pg.ImageItem(axisOrder='row-major')
+        self.image.setLookupTable(pg.colormap.get('viridis').getLookupTable())
+        self.map_plot.addItem(self.image)
+        self.row_line = pg.InfiniteLine(angle=0, movable=True)
+        self.column_line = pg.InfiniteLine(angle=90, movable=True)
+        for line in (self.row_line, self.column_line):
+            self.map_plot.addItem(line)
+            line.sigPositionChanged.connect(self.drawCuts)
+        # line cuts
+        self.row_plot = self.graph.addPlot(row=1, col=0)
+        self.row_curve = self.row_plot.plot([])
+        self.column_plot = self.graph.addPlot(row=2, col=0)
+        self.column_curve = self.column_plot.plot([])
+        self.graph.ci.layout.setRowStretchFactor(0, 3)
+
+    def setMap(self, info):
+        self.info = info
+        if info is None:
+            self.data = None
+            self.image.clear()
+            self.row_curve.setData([])
+            self.column_curve.setData([])
+            return
+        outer = np.asarray(info['outer'], dtype=np.float64)
+        inner = np.asarray(info['inner'], dtype=np.float64)
+        self.data = np.full((len(info['channels']), len(outer), len(inner)), np.nan)
+        # pixel centers on the setpoints
+        d_outer = (outer[-1] - outer[0]) / (len(outer) - 1) if len(outer) > 1 else 1.0
+        d_inner = (inner[-1] - inner[0]) / (len(inner) - 1) if len(inner) > 1 else 1.0
+        transform = QTransform()
+        transform.translate(inner[0] - d_inner / 2, outer[0] - d_outer / 2)
+        transform.scale(d_inner, d_outer)
+        self.image.setTransform(transform)
+        self.image.clear()
+        self.map_plot.setLabel('left', info['labels'][0])
+        self.map_plot.setLabel('bottom', info['labels'][1])
+        self.row_plot.setLabel('bottom', info['labels'][1])
+        self.column_plot.setLabel('bottom', info['labels'][0])
+        self.row_line.setPos(outer[len(outer) // 2])
+        self.column_line.setPos(inner[len(inner) // 2])
+        self.channel.blockSignals(True)
+        self.channel.clear()
+        self.channel.addItems(info['channels'])
+        self.channel.blockSignals(False)
+        self.map_plot.autoRange()
+
+    def addRow(self, line_id, data):
+        """ data = [x, y1, y2, ...] of the inner sweep line_id """
+        if self.data is None:
+            return
+        row = line_id - self.info['line']
+        if not 0 <= row < self.data.shape[1]:
+            return
+        n = min(data.shape[1], self.data.shape[2])
+        self.data[:, row, :n] = data[1:len(self.data)+1, :n]
+        self.drawMap()
+
+    def drawMap(self):
+        if self.data is None:
+            return
+        image = self.data[max(self.channel.currentIndex(), 0)]
+        if np.isnan(image).all():
+            return
+        self.image.setImage(image, autoLevels=False, levels=(np.nanmin(image), np.nanmax(image)))
+        self.drawCuts()
+
+    def nearestIndex(self, setpoints, value):
+        setpoints = np.asarray(setpoints, dtype=np.float64)
+        return int(np.abs(setpoints - value).argmin())
+
+    def drawCuts(self):
+        if self.data is None:
+            return
+        image = self.data[max(self.channel.currentIndex(), 0)]
+        row = self.nearestIndex(self.info['outer'], self.row_line.value())
+        column = self.nearestIndex(self.info['inner'], self.column_line.value())
+        self.row_curve.setData(np.asarray(self.info['inner'], dtype=np.float64), image[row], connect='finite')
+        self.column_curve.setData(np.asarray(self.info['outer'], dtype=np.float64), image[:, column], connect='finite')
@@ -1,4 +1,9 @@
 from .driver_interface import DriverInterface
+from .sweep_plan import SweepPlan, Step
+from .data_block import DataBlock
+from .line_buffer import LineBuffer
+from .saved_lines import SavedLines
 from .measurement_qtgraph import MeasurementQt
 from .utils import load_drivers, addtwodimdict, colorLoop, is_number
+from .run_store import RunStore
 from .txt_function import TxtFunction
@@ -0,0 +1,48 @@
+import numpy as np
+
+
+class DataBlock:
+    """ Rows of the same kind sent to the view and the txt file in one signal.
+
+        data[:, 0] is the control value, data[:, 1:] are the read channels.
+        All rows of a block share the file, the line, the control instrument
+        and whether they are plotted (innermost sweep) or saved (checked).
+    """
+
+    def __init__(self, file_count, line_count, plot, save, name_txt, method_txt):
+        self.file_count = file_count
+        self.line_count = line_count
+        self.plot = plot
+        self.save = save
+        # [control name, read name, ...] and [control method, read method, ...]
+        self.name_txt = list(name_txt)
+        self.method_txt = list(method_txt)
+        self.rows = []
+        self.data = None
+
+    def __len__(self):
+        if self.data is None:
+            return len(self.rows)
+        return len(self.data)
+
+    @property
+    def kind(self):
+        return (self.file_count, self.line_count, self.plot, self.save, self.name_txt[0], self.method_txt[0])
+
+    def append(self, x, y_show):
+        self.rows.append([x] + list(y_show))
+
+    def freeze(self):
+        """pack the rows in a read-only float64 array, the block must not change after that"""
+        self.data = np.array(self.rows, dtype=np.float64).reshape(len(self.rows), len(self.name_txt))
+        self.data.flags.writeable = False
+        self.rows = []
+        return self
+
+    @property
+    def x(self):
+        return self.data[:, 0]
+
+    @property
+    def y(self):
+        return self.data[:, 1:]
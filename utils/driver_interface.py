@@ -1,9 +1,18 @@
 import numpy as np
 import abc
+from time import sleep
 
 
 class DriverInterface(abc.ABC):
     METHOD = []
+    # time between two points of a continuous sweep (sec)
+    TIME_UNIT = 0.1
+    # RunControl of the running measurement
+    run_control = None
+    # shows a status message (ramp progress, ...) in the GUI
+    status_callback = None
+    # a continuous sweep is [target, placeholder, ...], the instrument ramps to the target by itself
+    PLACEHOLDER_SWEEP = False
 
     @abc.abstractmethod
     def performOpen(self):
@@ -25,11 +34,28 @@ class DriverInterface(abc.ABC):
         """Perform the Get Value instrument operation"""
         return NotImplemented
 
+    def performGetValues(self, options, magnifications):
+        """ Read several options at once, the values keep the order of options.
+            An instrument that can read them in one query overrides it.
+        """
+        return [self.performGetValue(option, magnification)
+                for option, magnification in zip(options, magnifications)]
+
     def __str__(self):
         return self.instrument_name
 
+    def performSweep(self, option, values, time_unit):
+        """ Output the values on the instrument clock, one every time_unit (sec).
+            Return False if the instrument cannot, the values are then set one by one.
+        """
+        return False
+
+    def stopSweep(self, option):
+        """Stop the output started by performSweep, the instrument holds its present value"""
+        pass
+
     def experimentLinspacer(self, option, target, speed, increment):
-        TIME_UNIT = 0.1
+        TIME_UNIT = self.TIME_UNIT
         init = float(self.performGetValue(option, 1))
         target = float(target)
         speed = float(speed)
@@ -43,6 +69,28 @@ class DriverInterface(abc.ABC):
             result = np.arange(init, target+increment, increment)
         return result
 
+    def setTimeUnit(self, time_unit):
+        self.TIME_UNIT = time_unit
+
+    def setRunControl(self, run_control):
+        self.run_control = run_control
+
+    def setStatusCallback(self, status_callback):
+        self.status_callback = status_callback
+
+    def reportStatus(self, message):
+        if self.status_callback is not None:
+            self.status_callback(f'{self}: {message}')
+
+    def settle(self, seconds):
+        """ wait for the instrument to settle, the wait ends early when the measurement is stopped.
+            return False if the wait was cut short
+        """
+        if self.run_control is None:
+            sleep(seconds)
+            return True
+        return self.run_control.sleep(seconds)
+
     def setProperty(self, visa_address, instrument_name, instrument_type):
         self.instrument_name = instrument_name
         self.instrument_type = instrument_type
@@ -0,0 +1,49 @@
+import numpy as np
+
+
+class LineBuffer:
+    """ Growable float64 buffer of the live line.
+
+        data[0] is x, data[1:] are the read channels, one contiguous row per
+        column so x and y(n) are views that can be given to setData directly.
+        The capacity doubles when it is full, appending is amortized O(1).
+    """
+
+    def __init__(self, columns, capacity=1024):
+        self.data = np.empty((columns, capacity), dtype=np.float64)
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    @property
+    def capacity(self):
+        return self.data.shape[1]
+
+    def append(self, rows):
+        """ rows = [[x, y1, y2, ...], ...] """
+        rows = np.asarray(rows, dtype=np.float64)
+        end = self.size + len(rows)
+        if end > self.capacity:
+            capacity = self.capacity
+            while capacity < end:
+                capacity *= 2
+            data = np.empty((len(self.data), capacity), dtype=np.float64)
+            data[:, :self.size] = self.data[:, :self.size]
+            self.data = data
+        self.data[:, self.size:end] = rows.T
+        self.size = end
+
+    @property
+    def x(self):
+        return self.data[0, :self.size]
+
+    def y(self, n):
+        return self.data[n + 1, :self.size]
+
+    def detach(self):
+        """ hand off the filled part without copying and start an empty line of the same capacity """
+        data = self.data[:, :self.size]
+        self.data = np.empty_like(self.data)
+        self.size = 0
+        return data
@@ -1,20 +1,29 @@
 import logging
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+import numpy as np
 from numpy import nan
-from PyQt5.QtCore import QThread, pyqtSignal, QObject
+from PyQt5.QtCore import pyqtSignal, QObject
 from modpack import TimeMeasurement
-from time import sleep, time
+from .sweep_plan import SweepPlan
+from .pacing import Pacer
+from .run_control import RunControl
+from .data_block import DataBlock
 
 
 class MeasurementQt(QObject):
     """this class is used to perform experiments"""
     finished = pyqtSignal(int)
-    signal_txt = pyqtSignal(int, list, list, list, list)
-    signal_plot = pyqtSignal(int, float, float, int)
-    signal_axis = pyqtSignal(list, list)
+    signal_block = pyqtSignal(object)
     signal_lines = pyqtSignal(int)
+    signal_map = pyqtSignal(object)
     signal_progress = pyqtSignal()
     clear_progress = pyqtSignal(int)
     page_information = pyqtSignal(str)
+    instrument_status = pyqtSignal(str)
+    # a DataBlock is sent when it has BLOCK_ROWS rows or FRAME_INTERVAL (sec) after the last one
+    BLOCK_ROWS = 256
+    FRAME_INTERVAL = 1 / 30
 
     def __init__(self):
         super().__init__()
@@ -23,30 +32,46 @@ class MeasurementQt(QObject):
         self.options_read = []
         self.magnification = []
         self.control_sequence = []
-        # control variable
-        self.stop_running = False
-        self.quit_running = False
-        self.quit_sweep = False
-        self.quit_loop = False
-
-    def setInfo(self, instruments, instruments_read, options_read, instruments_magnification, tree_info):
+        # read the instruments on different connections at the same time
+        self.parallel_read = False
+        self.read_groups = []
+        self.executor = None
+        # sample period of each level (sec), 0 = as fast as possible
+        self.sample_periods = []
+        # pause, skip sweep, quit loop and stop requests from the GUI
+        self.control = RunControl()
+        # rows waiting to be sent
+        self.block = None
+        self.last_flush = 0.0
+
+    def setInfo(self, instruments, instruments_read, options_read, instruments_magnification, tree_info, parallel_read=False, sample_periods=()):
         self.instruments = instruments.copy()
         self.instruments_read = instruments_read.copy()
         self.options_read = options_read.copy()
         self.magnification = instruments_magnification.copy()
+        self.parallel_read = parallel_read
+        self.sample_periods = list(sample_periods)
         self.schedule(tree_info)
-        # control variable
-        self.stop_running = False
-        self.quit_running = False
-        self.quit_sweep = False
-        self.quit_loop = False
+        self.control = RunControl()
         print(f'Ins Read:\n{self.instruments_read}')
 
     def openInstruments(self):
         """open instruments"""
         for instrument in self.instruments:
+            instrument.setRunControl(self.control)
+            instrument.setStatusCallback(self.instrument_status.emit)
             instrument.performOpen()
 
+    def groupReads(self):
+        """ return [[n, n, ...], [n, ...]]
+            indexes of instruments_read grouped by instrument,
+            the reads sharing one connection stay sequential and go through one performGetValues
+        """
+        groups = {}
+        for n, instrument_read in enumerate(self.instruments_read):
+            groups.setdefault(id(instrument_read), []).append(n)
+        return list(groups.values())
+
     def schedule(self, tree_info):
         """ return [tree1, tree2, tree3]
             tree view
@@ -87,10 +112,10 @@ class MeasurementQt(QObject):
             self.buildTree(i)
 
     def buildTree(self, info_tree):
-        """put [instruments, option] into [level_0, level_1, level_2]"""
+        """put [instruments, option] into [level_0, level_1, level_2, ...]"""
         # info_tree: [child_num, leve_position, instrument, method, check, target, speed, increment]
-        level = [[], [], []]
-        # level = [level0, level1, level2]  level0 = [[instrument,method,check,target,speed,increment], [instrument,method,check,target,speed,increment]...]
+        level = [[] for _ in info_tree]
+        # level = [level0, level1, ...]  level0 = [[instrument,method,check,target,speed,increment], [instrument,method,check,target,speed,increment]...]
         level_count = 0
         # put instrument in level
         for n, info in enumerate(info_tree):
@@ -117,133 +142,202 @@ class MeasurementQt(QObject):
         for n, instrument_read in enumerate(self.instruments_read):
             self.name_txt.append(instrument_read.instrumentName())
             self.method_txt.append(self.options_read[n])
+        self.read_groups = self.groupReads()
+        if self.parallel_read and len(self.read_groups) > 1:
+            self.executor = ThreadPoolExecutor(max_workers=len(self.read_groups))
 
         try:
-            for level in self.control_sequence:
-                if self.quit_running:
+            for levels in self.control_sequence:
+                if self.control.aborted:
                     break
-
-                if level[0] and level[1] and level[2]:
-                    self.page_information.emit(f'Run three levels measurement:')
-                    for ins in level[0]:
-                        self.page_information.emit(f'- {ins[0]}  {ins[3]}  {ins[4]}')
-                    for ins in level[1]:
-                        self.page_information.emit(f'-- {ins[0]}  {ins[3]}  {ins[4]}')
-                    for ins in level[2]:
-                        self.page_information.emit(f'--- {ins[0]}  {ins[3]}  {ins[4]}')
-                    self.threeLevelsTree(level)
-
-                elif level[0] and level[1] and not level[2]:
-                    self.page_information.emit(f'Run two levels measurement:')
-                    for ins in level[0]:
-                        self.page_information.emit(f'- {ins[0]}  {ins[3]}  {ins[4]}')
-                    for ins in level[1]:
-                        self.page_information.emit(f'-- {ins[0]}  {ins[3]}  {ins[4]}')
-                    self.twoLevelsTree(level)
-
-                elif level[0] and not level[1] and not level[2]:
-                    self.page_information.emit(f'Run one level measurement:')
-                    for ins in level[0]:
-                        self.page_information.emit(f'- {ins[0]}  {ins[3]}  {ins[4]}')
-                    self.oneLevelTree(level)
+                # the setpoints start from the present instrument values,
+                # so each tree is compiled only when it is reached
+                plan = SweepPlan(levels, self.sample_periods)
+                if not plan:
+                    continue
+                self.page_information.emit(f'Run {len(plan)} level(s) measurement:')
+                for depth, level in enumerate(plan.levels):
+                    for ins in level:
+                        self.page_information.emit(f'{"-" * (depth+1)} {ins[0]}  {ins[3]}  {ins[4]}  ({plan.periods[depth]:g} s)')
+                self.signal_map.emit(self.mapInfo(plan))
+                self.runPlan(plan)
         except:
             logging.exception('measure error')
 
+        self.flushBlock()
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
         self.finished.emit(self.file_count)
 
-    def threeLevelsTree(self, level):
-        for i in level[0]:  # i = [instrument,method,check,target,speed,increment]
-            linspacer = i[0].experimentLinspacer(i[1], i[3], i[4], i[5])
-            self.clear_progress.emit(len(linspacer))
-            for value_i in linspacer:
-                if self.performRecord(i, value_i):
-                    break
+    def mapInfo(self, plan):
+        """ the geometry of the live 2D map, None if the plan is not a two-level sweep
+            with one instrument per level. Every inner sweep fills the row line - info['line']
+            The axes are the setpoints, so there is no map when a level is timed: its
+            setpoints are then ramp placeholders ('nan', -999) or nominal times.
+        """
+        if len(plan) != 2 or any(len(level) != 1 for level in plan.levels):
+            return None
+        if any(plan.timed(level[0]) for level in plan.levels):
+            return None
+        for setpoints in plan.setpoints:
+            try:
+                axis = np.asarray(setpoints[0], dtype=np.float64)
+            except (TypeError, ValueError):
+                return None
+            if not len(axis) or not np.isfinite(axis).all():
+                return None
+        return {'line': self.line_count,
+                'outer': plan.setpoints[0][0],
+                'inner': plan.setpoints[1][0],
+                'labels': [f'{level[0][0]} {level[0][1]}' for level in plan.levels],
+                'channels': [f'{self.name_txt[n]} {self.method_txt[n]}' for n in range(1, len(self.name_txt))]}
+
+    def runPlan(self, plan):
+        """run every step of the plan, the innermost level is the plotted sweep"""
+        pacers = [Pacer(period, self.control) for period in plan.periods]
+        last_level = None
+        # the innermost sweep is generated by the instrument itself
+        streaming = False
+        steps = plan.steps()
+        step = next(steps, None)
+        while step is not None:
+            bottom_level = step.level == plan.bottom
+            if step.level == 0 and step.index == 0:
+                self.clear_progress.emit(step.length)
+            if not step.length:
+                # an empty innermost sweep still ends a line, as an empty one
+                if bottom_level:
+                    self.endSweep(step.instrument)
+                step = next(steps, None)
+                continue
+            # the time spent in the deeper levels is not an overrun
+            pacer = pacers[step.level]
+            if step.level != last_level or step.index == 0:
+                pacer.reset()
+            last_level = step.level
+
+            if step.index == 0 and not self.rampToStart(step, bottom_level):
+                # interrupted on the way to the first setpoint
+                skip = 1
+            else:
+                if bottom_level and streaming and self.control.paused:
+                    # a waveform cannot pause, it restarts from this point after the pause
+                    self.stopStream(step)
+                    self.flushBlock()
+                    streaming = self.control.checkpoint() and self.startStream(step, plan.periods[step.level])
+                    pacer.reset()
+                elif bottom_level and step.index == 0:
+                    streaming = self.startStream(step, plan.periods[step.level])
+
+                skip = self.performRecord(step.instrument, step.value, pacer, bottom_level, streaming)
+            if step.level == 0 and not skip:
                 self.signal_progress.emit()
 
-                for j in level[1]:
-                    for value_j in j[0].experimentLinspacer(j[1], j[3], j[4], j[5]):
-                        if self.performRecord(j, value_j):
-                            break
-
-                        for k in level[1]:
-                            for value_k in k[0].experimentLinspacer(k[1], k[3], k[4], k[5]):
-                                if self.performRecord(k, value_k, True):
-                                    break
-                                if self.quit_sweep:
-                                    self.quit_sweep = False
-                                    break
-                                if self.quit_loop:
-                                    self.quit_loop = False
-                                    return
-
-                            self.signal_lines.emit(self.line_count)
-                            sleep(0.1)
-                            self.line_count += 1
-                            if int(k[2]):
-                                self.file_count += 1
-
-    def twoLevelsTree(self, level):
-        for i in level[0]:
-            linspacer = i[0].experimentLinspacer(i[1], i[3], i[4], i[5])
-            self.clear_progress.emit(len(linspacer))
-            for value_i in linspacer:
-                if self.performRecord(i, value_i):
-                    break
-                self.signal_progress.emit()
+            if self.control.consumeQuitLoop():
+                if streaming:
+                    self.stopStream(step)
+                return
+            if bottom_level:
+                if self.control.consumeSkipSweep():
+                    skip = True
+                if skip or step.index == step.length - 1:
+                    if streaming:
+                        self.stopStream(step)
+                        streaming = False
+                    self.endSweep(step.instrument)
+                    self.reportPacing(pacer, step.level)
 
-                for j in level[1]:
-                    for value_j in j[0].experimentLinspacer(j[1], j[3], j[4], j[5]):
-                        if self.performRecord(j, value_j, True):
-                            break
-                        if self.quit_sweep:
-                            self.quit_sweep = False
-                            break
-                        if self.quit_loop:
-                            self.quit_loop = False
-                            return
-
-                    self.signal_lines.emit(self.line_count)
-                    sleep(0.1)
-                    self.line_count += 1
-                    if int(j[2]):
-                        self.file_count += 1
-
-    def oneLevelTree(self, level):
-        for i in level[0]:
-            linspacer = i[0].experimentLinspacer(i[1], i[3], i[4], i[5])
-            self.clear_progress.emit(len(linspacer))
-            for value_i in linspacer:
-                if self.performRecord(i, value_i, True):
-                    break
-                self.signal_progress.emit()
-                if self.quit_sweep:
-                    self.quit_sweep = False
-                    break
-                if self.quit_loop:
-                    self.quit_loop = False
-                    return
+            try:
+                step = steps.send(skip)
+            except StopIteration:
+                step = None
+
+        for level, pacer in enumerate(pacers):
+            self.reportPacing(pacer, level)
+
+    def rampToStart(self, step, bottom_level):
+        """ The setpoints of a continuous sweep are compiled once, from the value at the start.
+            A repeat of the sweep begins where the previous one ended, so the instrument
+            is ramped back to the first setpoint at the row speed instead of jumping there.
+            return False if the ramp is interrupted
+        """
+        instrument_info = step.instrument
+        if (instrument_info[5] != '0' or not SweepPlan.timed(instrument_info)
+                or instrument_info[0].PLACEHOLDER_SWEEP):
+            return True
+        return self.ramp(instrument_info, step.value, bottom_level)
+
+    def ramp(self, instrument_info, value, bottom_level):
+        """ go to value at the row speed, one step per TIME_UNIT of the instrument.
+            return False if the ramp is interrupted
+        """
+        # the ramp is computed with the instrument TIME_UNIT and must keep it to respect the speed
+        ramp_pacer = Pacer(instrument_info[0].TIME_UNIT, self.control)
+        for value_increment in instrument_info[0].experimentLinspacer(instrument_info[1], value, instrument_info[4], '0'):
+            ramp_pacer.begin()
+            try:
+                incre_value = instrument_info[0].performSetValue(instrument_info[1], value_increment)
+            except:
+                logging.exception('increment error')
+                incre_value = nan
+            if incre_value == 'done':
+                break
+            # never jump to the setpoint from an interrupted ramp
+            if not ramp_pacer.wait(bottom_level):
+                return False
+        return True
+
+    def startStream(self, step, period):
+        """ Let the instrument generate the rest of a continuous sweep on its own clock.
+            return False if the values have to be set one by one
+        """
+        instrument_info = step.instrument
+        if period <= 0 or instrument_info[5] != '0' or not hasattr(instrument_info[0], 'performSweep'):
+            return False
+        try:
+            return bool(instrument_info[0].performSweep(instrument_info[1], step.setpoints[step.index:], period))
+        except:
+            logging.exception('sweep error')
+            return False
 
-            self.signal_lines.emit(self.line_count)
-            sleep(0.1)
-            self.line_count += 1
-            if int(i[2]):
-                self.file_count += 1
+    def stopStream(self, step):
+        try:
+            step.instrument[0].stopSweep(step.instrument[1])
+        except:
+            logging.exception('stop sweep error')
+
+    def reportPacing(self, pacer, level):
+        message = pacer.report()
+        if message:
+            self.page_information.emit(f'Level {level}: {message}')
+
+    def endSweep(self, instrument_info):
+        """the innermost sweep is finished, save the line and move to the next file"""
+        self.flushBlock()
+        self.signal_lines.emit(self.line_count)
+        self.line_count += 1
+        if int(instrument_info[2]):
+            self.file_count += 1
 
-    def performRecord(self, instrument_info, value, bottom_level=False):
-        while self.stop_running:
-            QThread.sleep(1)
+    def performRecord(self, instrument_info, value, pacer, bottom_level=False, streaming=False):
+        """ set the value (ramping to it if needed) and read every channel.
+            return 1 if the sweep of this instrument has to stop here
+        """
+        if self.control.paused:
+            self.flushBlock()
+        if not self.control.checkpoint():
+            return 1
 
         # instrument_info = instrument method check target speed increment
+        if streaming:
+            # the instrument is already generating the sweep, record the value it outputs now
+            pacer.begin()
+            return self.recordPoint(instrument_info, instrument_info[0].performGetValue(instrument_info[1], 1), pacer, bottom_level)
         if instrument_info[5] != '0' and instrument_info[5] != '-':
-            for value_increment in instrument_info[0].experimentLinspacer(instrument_info[1], value, instrument_info[4], '0'):
-                try:
-                    incre_value = instrument_info[0].performSetValue(instrument_info[1], value_increment)
-                except:
-                    logging.exception('increment error')
-                    incre_value = nan
-                if incre_value == 'done':
-                    break
-                sleep(0.1)
+            if not self.ramp(instrument_info, value, bottom_level):
+                return 1
+        pacer.begin()
         try:
             set_value = instrument_info[0].performSetValue(instrument_info[1], value)
         except:
@@ -251,45 +345,81 @@ class MeasurementQt(QObject):
             set_value = nan
         if set_value == 'done':
             return 1
+        return self.recordPoint(instrument_info, set_value, pacer, bottom_level)
 
-        start_time = time()
-        x_show = [set_value, instrument_info[0].instrumentName(), instrument_info[1]]
-        y_show = []
-
+    def recordPoint(self, instrument_info, set_value, pacer, bottom_level):
+        """read every channel and publish the row"""
         self.name_txt[0] = instrument_info[0].instrumentName()
         self.method_txt[0] = instrument_info[1]
 
-        for n, instrument_read in enumerate(self.instruments_read):
-            try:
-                read_value = instrument_read.performGetValue(self.options_read[n], self.magnification[n])
-            except:
-                logging.exception('read_value error') # exc_info=False
-                read_value = nan
-            y_show.append(read_value)
-            if bottom_level:
-                self.signal_plot.emit(n, set_value, read_value, self.line_count)
+        y_show = self.readAll()
+        self.publish(set_value, y_show, bottom_level, bool(int(instrument_info[2])))
 
-        self.signal_axis.emit(x_show, y_show)
-        if int(instrument_info[2]):
-            self.signal_txt.emit(self.file_count, self.method_txt, self.name_txt, x_show, y_show)
-        
-        elapsed_time = round(time() - start_time, 2)
-        if elapsed_time < 0.1:
-            sleep(0.1-elapsed_time)
+        pacer.wait(bottom_level)
         return 0
 
-    def resumePauseMeasure(self):
-        if self.stop_running == False:
-            self.stop_running = True
+    def publish(self, x, y_show, bottom_level, save):
+        """add a row to the block, rows of another kind start a new block"""
+        kind = (self.file_count, self.line_count, bottom_level, save, self.name_txt[0], self.method_txt[0])
+        if self.block is not None and self.block.kind != kind:
+            self.flushBlock()
+        if self.block is None:
+            self.block = DataBlock(self.file_count, self.line_count, bottom_level, save, self.name_txt, self.method_txt)
+        self.block.append(x, y_show)
+        if len(self.block) >= self.BLOCK_ROWS or perf_counter() - self.last_flush >= self.FRAME_INTERVAL:
+            self.flushBlock()
+
+    def flushBlock(self):
+        if self.block is not None:
+            self.signal_block.emit(self.block.freeze())
+            self.block = None
+        self.last_flush = perf_counter()
+
+    def readValue(self, n):
+        try:
+            read_value = self.instruments_read[n].performGetValue(self.options_read[n], self.magnification[n])
+        except:
+            logging.exception('read_value error') # exc_info=False
+            read_value = nan
+        return read_value
+
+    def readGroup(self, group):
+        """ read the channels of one instrument with a single performGetValues,
+            if it fails every channel is read alone so only the bad one is NaN
+        """
+        instrument = self.instruments_read[group[0]]
+        try:
+            values = instrument.performGetValues([self.options_read[n] for n in group],
+                                                 [self.magnification[n] for n in group])
+            if len(values) == len(group):
+                return values
+            logging.error(f'{instrument}: performGetValues returned {len(values)} values for {len(group)} channels')
+        except:
+            logging.exception('read_values error')
+        return [self.readValue(n) for n in group]
+
+    def readAll(self):
+        """read every channel, the result keeps the order of instruments_read"""
+        y_show = [nan] * len(self.instruments_read)
+        if self.executor is None:
+            results = map(self.readGroup, self.read_groups)
         else:
-            self.stop_running = False
+            # one task per connection, the slowest instrument sets the time of the point
+            results = self.executor.map(self.readGroup, self.read_groups)
+        for group, values in zip(self.read_groups, results):
+            for n, read_value in zip(group, values):
+                y_show[n] = read_value
+        return y_show
+
+    # the requests below are called from the GUI thread
+    def resumePauseMeasure(self):
+        self.control.togglePause()
 
     def quitSweepMeasure(self):
-        self.quit_sweep = True
+        self.control.skipSweep()
 
     def stopMeasure(self):
-        self.quit_running = True
-        self.quit_loop = True
+        self.control.abort()
 
     def quitLoopMeasure(self):
-        self.quit_loop = True
+        self.control.quitLoop()
@@ -0,0 +1,73 @@
+from time import perf_counter, sleep
+
+
+class Pacer:
+    """ Pace the points of a sweep on absolute deadlines.
+
+        Point k is due at t0 + k*period, so the time spent on setting and
+        reading does not accumulate as drift. A point that ends after its
+        deadline is counted as an overrun and the schedule restarts from now.
+        period = 0 runs the points as fast as possible.
+        With a RunControl the waits can be interrupted and the time spent in
+        pause shifts the schedule instead of counting as an overrun.
+    """
+
+    def __init__(self, period, control=None):
+        self.period = max(float(period), 0.0)
+        self.control = control
+        self.deadline = None
+        self.paused_time = 0.0
+        self.points = 0
+        self.overruns = 0
+        self.worst = 0.0
+
+    def reset(self):
+        """start a new schedule at the next point"""
+        self.deadline = None
+
+    def begin(self):
+        """call at the start of a point"""
+        if self.deadline is None:
+            self.deadline = perf_counter() + self.period
+            self.paused_time = self.pausedTime()
+
+    def pausedTime(self):
+        return 0.0 if self.control is None else self.control.paused_time
+
+    def shiftPause(self):
+        """move the schedule by the time spent in pause"""
+        paused_time = self.pausedTime()
+        self.deadline += paused_time - self.paused_time
+        self.paused_time = paused_time
+
+    def wait(self, skippable=False):
+        """ call at the end of a point, sleep until its deadline.
+            return False if the wait is interrupted by the RunControl
+        """
+        self.points += 1
+        self.shiftPause()
+        late = perf_counter() - self.deadline
+        if not self.period or late > 0:
+            if self.period:
+                self.overruns += 1
+                self.worst = max(self.worst, late)
+                self.deadline += late + self.period
+            return self.control is None or not self.control.interrupted(skippable)
+        self.deadline += self.period
+        if self.control is None:
+            sleep(-late)
+            return True
+        done = self.control.sleep(-late, skippable)
+        self.shiftPause()
+        return done
+
+    def report(self):
+        """ return a message about the overruns since the last report, or '' """
+        message = ''
+        if self.overruns:
+            message = (f'{self.overruns} of {self.points} points overran the {self.period:g} s period '
+                       f'(worst {self.worst*1000:.0f} ms)')
+        self.points = 0
+        self.overruns = 0
+        self.worst = 0.0
+        return message
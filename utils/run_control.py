@@ -0,0 +1,112 @@
+import threading
+from time import perf_counter
+
+
+class RunControl:
+    """ Control channel between the GUI and the measurement worker.
+
+        The GUI thread calls pause/resume/skipSweep/quitLoop/abort, the worker
+        waits on the condition in checkpoint() and sleep(), so every request
+        wakes the worker at once instead of at the end of a polling interval.
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self.paused = False
+        self.aborted = False
+        self.quit_loop = False
+        self.quit_sweep = False
+        self._pause_start = 0.0
+        self._paused_time = 0.0
+
+    # =============================================================================
+    # GUI side
+    # =============================================================================
+
+    def pause(self):
+        with self._condition:
+            if not self.paused:
+                self.paused = True
+                self._pause_start = perf_counter()
+            self._condition.notify_all()
+
+    def resume(self):
+        with self._condition:
+            if self.paused:
+                self.paused = False
+                self._paused_time += perf_counter() - self._pause_start
+            self._condition.notify_all()
+
+    def togglePause(self):
+        if self.paused:
+            self.resume()
+        else:
+            self.pause()
+
+    def skipSweep(self):
+        """quit the running innermost sweep"""
+        with self._condition:
+            self.quit_sweep = True
+            self._condition.notify_all()
+
+    def quitLoop(self):
+        """quit the running tree"""
+        with self._condition:
+            self.quit_loop = True
+            self._condition.notify_all()
+
+    def abort(self):
+        """quit the whole measurement"""
+        with self._condition:
+            self.aborted = True
+            self.quit_loop = True
+            self._condition.notify_all()
+
+    # =============================================================================
+    # worker side
+    # =============================================================================
+
+    @property
+    def paused_time(self):
+        """total time spent in pause (sec)"""
+        with self._condition:
+            if self.paused:
+                return self._paused_time + perf_counter() - self._pause_start
+            return self._paused_time
+
+    def interrupted(self, skippable=False):
+        return self.aborted or self.quit_loop or (skippable and self.quit_sweep)
+
+    def consumeSkipSweep(self):
+        with self._condition:
+            quit_sweep, self.quit_sweep = self.quit_sweep, False
+            return quit_sweep
+
+    def consumeQuitLoop(self):
+        with self._condition:
+            quit_loop, self.quit_loop = self.quit_loop, False
+            return quit_loop
+
+    def checkpoint(self):
+        """block while paused, return False if the run is interrupted"""
+        with self._condition:
+            self._condition.wait_for(lambda: not self.paused or self.interrupted())
+            return not self.interrupted()
+
+    def sleep(self, seconds, skippable=False):
+        """ Sleep for seconds of running time, the pause is not counted.
+            Return False as soon as the run is interrupted.
+        """
+        remaining = seconds
+        with self._condition:
+            while True:
+                if self.interrupted(skippable):
+                    return False
+                if self.paused:
+                    self._condition.wait()
+                    continue
+                if remaining <= 0:
+                    return True
+                start = perf_counter()
+                self._condition.wait(remaining)
+                remaining -= perf_counter() - start
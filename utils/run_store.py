@@ -0,0 +1,82 @@
+import logging
+import numpy as np
+try:
+    import h5py
+except ImportError as e:
+    h5py = None
+    logging.warning(f'{e}, the binary run store is disabled')
+
+
+class RunStore:
+    """ Binary copy of a run in {file_name}.h5, written next to the csv files.
+
+        sequences/{n} is the float64 dataset of sequence n (one checked sweep),
+        columns are [x, y1, y2, ...], it grows by chunks of CHUNK_ROWS rows.
+        The channel names, units and the step recipe are attributes.
+        At close, map is a virtual (sequence, row, column) view of all the
+        sequences padded with NaN, so a whole 2D map is a single read:
+            with h5py.File(name) as f: data = f['map'][()]
+    """
+    CHUNK_ROWS = 1024
+
+    def __init__(self):
+        self.file = None
+        self.units = []
+
+    @staticmethod
+    def available():
+        return h5py is not None
+
+    def open(self, file_name, units, recipe=''):
+        self.close()
+        if h5py is None:
+            return
+        self.file = h5py.File(f'{file_name}.h5', 'w')
+        self.units = [''] + list(units)
+        self.file.attrs['units'] = self.units
+        self.file.attrs['recipe'] = recipe
+        self.file.create_group('sequences')
+
+    def append(self, block):
+        """ append the rows of a frozen DataBlock to the dataset of its sequence """
+        if self.file is None:
+            return
+        sequences = self.file['sequences']
+        key = str(block.file_count)
+        if key not in sequences:
+            columns = len(block.name_txt)
+            dataset = sequences.create_dataset(key, shape=(0, columns), maxshape=(None, columns),
+                                               chunks=(self.CHUNK_ROWS, columns), dtype=np.float64)
+            dataset.attrs['channels'] = [f'{block.name_txt[i]}_{block.method_txt[i]}' for i in range(columns)]
+            dataset.attrs['units'] = self.units[:columns]
+        dataset = sequences[key]
+        rows = len(dataset)
+        dataset.resize(rows + len(block), axis=0)
+        dataset[rows:] = block.data
+
+    def flush(self):
+        if self.file is not None:
+            self.file.flush()
+
+    def close(self):
+        if self.file is None:
+            return
+        try:
+            self.buildMap()
+        finally:
+            self.file.close()
+            self.file = None
+
+    def buildMap(self):
+        """ map[n, :len(sequences/n), :] = sequences/n, the rest is NaN """
+        datasets = [self.file['sequences'][key] for key in sorted(self.file['sequences'], key=int)]
+        if not datasets:
+            return
+        rows = max(len(dataset) for dataset in datasets)
+        columns = max(dataset.shape[1] for dataset in datasets)
+        layout = h5py.VirtualLayout(shape=(len(datasets), rows, columns), dtype=np.float64)
+        for n, dataset in enumerate(datasets):
+            if len(dataset):
+                layout[n, :len(dataset), :dataset.shape[1]] = h5py.VirtualSource(dataset)
+        self.file.create_virtual_dataset('map', layout, fillvalue=np.nan)
+        self.file['map'].attrs['sequences'] = [int(dataset.name.split('/')[-1]) for dataset in datasets]
@@ -0,0 +1,66 @@
+import numpy as np
+from .line_buffer import LineBuffer
+
+
+class SavedLines:
+    """ The saved sweeps of every read channel, packed by chunks.
+
+        The points of CHUNK_LINES consecutive lines are concatenated in one
+        LineBuffer. A chunk is drawn with one item per channel and color, and
+        curve() separates the lines with a connect mask, so the number of
+        graphics items grows with sweeps / CHUNK_LINES, not sweeps * channels.
+        visible[k] tells if the k-th saved line is selected.
+    """
+    CHUNK_LINES = 256
+
+    def __init__(self, channels):
+        self.channels = channels
+        # LineBuffer of [x, y1, y2, ...] and the start of every line in it (+ the end)
+        self.chunks = []
+        self.starts = []
+        # line id, color of each channel and selection of each saved line
+        self.ids = []
+        self.colors = []
+        self.visible = np.zeros(0, dtype=bool)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def add(self, line_id, data, colors, visible=True):
+        """ data = [x, y1, y2, ...] of one line, colors = color of each channel.
+            return the chunk of the line
+        """
+        chunk = len(self.ids) // self.CHUNK_LINES
+        if chunk == len(self.chunks):
+            self.chunks.append(LineBuffer(self.channels + 1))
+            self.starts.append([0])
+        self.chunks[chunk].append(data.T)
+        self.starts[chunk].append(len(self.chunks[chunk]))
+        self.ids.append(line_id)
+        self.colors.append(list(colors))
+        self.visible = np.append(self.visible, visible)
+        return chunk
+
+    def setVisible(self, line_ids):
+        """ select the lines whose id is in line_ids, return the chunks where the selection changed """
+        visible = np.isin(np.asarray(self.ids, dtype=np.int64), np.asarray(list(line_ids), dtype=np.int64))
+        changed = np.flatnonzero(visible != self.visible)
+        self.visible = visible
+        return set((changed // self.CHUNK_LINES).tolist())
+
+    def curve(self, chunk, channel, color):
+        """ x, y and connect of the selected lines of a chunk drawn with color """
+        first = chunk * self.CHUNK_LINES
+        lengths = np.diff(np.asarray(self.starts[chunk], dtype=np.int64))
+        colors = self.colors[first:first + len(lengths)]
+        shown = self.visible[first:first + len(lengths)] & np.array(
+            [tuple(line_colors[channel]) == tuple(color) for line_colors in colors], dtype=bool)
+        points = np.repeat(shown, lengths)
+        point_line = np.repeat(np.arange(len(lengths), dtype=np.int64), lengths)[points]
+        x = self.chunks[chunk].x[points]
+        y = self.chunks[chunk].y(channel)[points]
+        # connect a point to the next one of the same line, NaN points are dropped
+        finite = np.isfinite(x) & np.isfinite(y)
+        connect = np.zeros(len(x), dtype=bool)
+        connect[:-1] = (point_line[:-1] == point_line[1:]) & finite[:-1] & finite[1:]
+        return x[finite], y[finite], connect[finite]
@@ -0,0 +1,81 @@
+from collections import namedtuple
+
+
+# one point of the experiment: the level it belongs to, the control info
+# [instrument, method, check, target, speed, increment], the setpoint,
+# its position inside the sweep of that instrument and all the setpoints of the sweep
+Step = namedtuple('Step', ['level', 'instrument', 'value', 'index', 'length', 'setpoints'])
+
+
+class SweepPlan:
+    """ Compiled form of one control tree.
+
+        levels = [level0, level1, ...]
+        level0 = [[instrument, method, check, target, speed, increment], ...]
+
+        The setpoints of every instrument are computed once here, so the
+        instruments are queried for their initial value only at compile time.
+        periods[n] is the sample period (sec) of level n, 0 = as fast as possible.
+        A level with a timed sweep keeps SAMPLE_PERIOD instead of 0, its
+        setpoints are one TIME_UNIT apart and must be paced to keep the speed.
+        Only the timed sweeps take the period as TIME_UNIT.
+    """
+    SAMPLE_PERIOD = 0.1
+
+    def __init__(self, levels, periods=()):
+        # drop the empty levels at the end of the tree
+        self.levels = [level for level in levels if level]
+        self.periods = [periods[n] if n < len(periods) else self.SAMPLE_PERIOD
+                        for n in range(len(self.levels))]
+        self.setpoints = []
+        for n, level in enumerate(self.levels):
+            if self.periods[n] <= 0 and any(self.timed(info) for info in level):
+                self.periods[n] = self.SAMPLE_PERIOD
+            for info in level:
+                # timed sweeps put one setpoint per period, the others ramp
+                # between their setpoints with the default TIME_UNIT
+                if self.timed(info):
+                    info[0].setTimeUnit(self.periods[n])
+                else:
+                    info[0].setTimeUnit(type(info[0]).TIME_UNIT)
+            self.setpoints.append([info[0].experimentLinspacer(info[1], info[3], info[4], info[5])
+                                   for info in level])
+
+    @staticmethod
+    def timed(info):
+        """ True for a sweep given by its speed (increment 0) or a Time Meas (increment '-') """
+        increment = info[5]
+        if increment == '-':
+            return True
+        try:
+            return float(increment) == 0 and float(info[4]) != 0
+        except ValueError:
+            return False
+
+    def __len__(self):
+        return len(self.levels)
+
+    @property
+    def bottom(self):
+        """index of the innermost level"""
+        return len(self.levels) - 1
+
+    def steps(self):
+        """ Flat iterator of Step for the whole tree (depth first).
+            Send True to the generator to skip the rest of the current sweep.
+            A sweep without setpoint gives one Step of length 0 and value None.
+        """
+        return self._walk(0)
+
+    def _walk(self, depth):
+        for info, setpoints in zip(self.levels[depth], self.setpoints[depth]):
+            length = len(setpoints)
+            if not length:
+                yield Step(depth, info, None, 0, 0, setpoints)
+                continue
+            for index, value in enumerate(setpoints):
+                skip = yield Step(depth, info, value, index, length, setpoints)
+                if skip:
+                    break
+                if depth < self.bottom:
+                    yield from self._walk(depth + 1)
@@ -1,59 +1,172 @@
 # -*- coding: utf-8 -*-
-import pandas as pd
 import os
 import csv
 import glob
+import logging
+import threading
+from itertools import zip_longest
+from concurrent.futures import ThreadPoolExecutor, wait
 from datetime import datetime
 from PyQt5.QtCore import QObject
+from .run_store import RunStore
 
 
 class TxtFunction(QObject):
     """ Write data to txt file """
+    # rows are kept in the file buffer at most FLUSH_INTERVAL (sec) or BUFFER_ROWS rows
+    FLUSH_INTERVAL = 1.0
+    BUFFER_ROWS = 1000
+    # completed sequences are merged side by side in groups of MERGE_GROUP during the run
+    MERGE_GROUP = 64
 
     def __init__(self) -> None:
         super().__init__()
-        
+        # the open file of the active sequence
+        self.txt_num = None
+        self.txt_file = None
+        self.txt_writer = None
+        self.txt_rows = 0
+        self.flush_timer = None
+        # the flush timer runs in its own thread
+        self.txt_lock = threading.Lock()
+        # ./data/merge_{n}.csv holds the sequences [n*MERGE_GROUP, (n+1)*MERGE_GROUP)
+        self.merged_groups = 0
+        self.merge_jobs = []
+        self.merge_executor = ThreadPoolExecutor(max_workers=1)
+        # binary copy of the run, written with the csv files
+        self.run_store = RunStore()
+
     def setUnits(self, units):
         self.units = units
 
-    def txtUpdate(self, sequence_num, method, name, x_show, y_show):
+    def txtUpdate(self, block):
+        """ write the rows of a DataBlock, only the checked rows are saved """
+        if not block.save:
+            return
+        with self.txt_lock:
+            # a new sequence closes the file of the previous one
+            if block.file_count != self.txt_num:
+                self.txtOpen(block.file_count, block.method_txt, block.name_txt)
+            # every row is [x, y1, y2, ...]
+            self.txt_writer.writerows(block.data.tolist())
+            self.run_store.append(block)
+            self.txt_rows += len(block)
+            if self.txt_rows >= self.BUFFER_ROWS:
+                self.txtFlushLocked()
+            elif self.flush_timer is None:
+                self.flush_timer = threading.Timer(self.FLUSH_INTERVAL, self.txtFlush)
+                self.flush_timer.daemon = True
+                self.flush_timer.start()
+
+    def txtOpen(self, sequence_num, method, name):
+        """ open ./data/{sequence_num}.csv for appending, creat it with the title if needed """
+        self.txtCloseLocked()
         # user the sequence_num to choose the txt
         txtname = f'./data/{sequence_num}.csv'
+        new_txt = not os.path.exists(txtname)
+        self.txt_file = open(txtname, 'a', newline='')
+        self.txt_writer = csv.writer(self.txt_file)
+        self.txt_num = sequence_num
+        self.mergeGroups(sequence_num)
+        if new_txt:
+            # reconstruct the title as name_method, e.g., SR830_Frequency
+            self.txt_writer.writerow([f'{name[i]}_{method[i]}' for i in range(len(name))])
+
+    def txtFlush(self):
+        with self.txt_lock:
+            self.txtFlushLocked()
+
+    def txtFlushLocked(self):
+        if self.flush_timer is not None:
+            self.flush_timer.cancel()
+            self.flush_timer = None
+        if self.txt_file is not None:
+            self.txt_file.flush()
+            os.fsync(self.txt_file.fileno())
+        self.run_store.flush()
+        self.txt_rows = 0
+
+    def txtClose(self):
+        """ close the file of the active sequence, called when the measurement stops """
+        with self.txt_lock:
+            self.txtCloseLocked()
 
-        def txtCreat(method, name):
-            """ creat a new txt """
-            # generate the title_list to be a header in the txt
-            title_list = []
-            for i in range(len(name)):
-                # reconstruct them as name_method, e.g., SR830_Frequency
-                temp_title = f'{name[i]}_{method[i]}'
-                # append the title_list
-                title_list.append(temp_title)
-
-            self.txtWriter(txtname, title_list, 'w')
-
-        def txtSaver(x_show, y_show):
-            # copy y_show list to temp_data
-            temp_data = y_show.copy()
-            # insert the x value to the y side
-            temp_data.insert(0, x_show[0])
-            # open file
-            self.txtWriter(txtname, temp_data, 'a')
-
-        # if the seq_num equals to txt_count, it means it has to creat a new txt before writing
-        if os.path.exists(txtname):
-            # write the data
-            txtSaver(x_show, y_show)
-        else:
-            # creat empty txt
-            txtCreat(method, name)
-            # write the data
-            txtSaver(x_show, y_show)
+    def txtCloseLocked(self):
+        self.txtFlushLocked()
+        if self.txt_file is not None:
+            self.txt_file.close()
+        self.txt_num = None
+        self.txt_file = None
+        self.txt_writer = None
+
+    def storeOpen(self, file_name):
+        """ start the binary run store {file_name}.h5 with the units and the recorded steps """
+        recipe = ''
+        if os.path.exists('./ui/asset/step.txt'):
+            with open('./ui/asset/step.txt') as f:
+                recipe = f.read()
+        with self.txt_lock:
+            self.run_store.open(file_name, self.units, recipe)
+
+    def storeClose(self):
+        with self.txt_lock:
+            self.run_store.close()
 
     # =============================================================================
     # Merge file. activate when stopping
     # =============================================================================
 
+    def mergeGroups(self, sequence_num):
+        """ the sequences before sequence_num are complete, merge every full group in the background """
+        while (self.merged_groups + 1) * self.MERGE_GROUP <= sequence_num:
+            start = self.merged_groups * self.MERGE_GROUP
+            names = [f'./data/{i}.csv' for i in range(start, start + self.MERGE_GROUP)]
+            self.merge_jobs.append(self.merge_executor.submit(
+                self.txtMergeGroup, names, f'./data/merge_{self.merged_groups}.csv'))
+            self.merged_groups += 1
+
+    def waitMerges(self):
+        """ wait for the background merges, the exception of a failed merge is raised here """
+        jobs, self.merge_jobs = self.merge_jobs, []
+        wait(jobs)
+        for job in jobs:
+            job.result()
+
+    def txtMergeGroup(self, names, output_name):
+        with open(output_name, 'w', newline='') as output:
+            self.txtSideBySide(names, output)
+
+    @staticmethod
+    def txtSideBySide(names, output):
+        """ Write the csv files side by side, line by line, into the open file output.
+            Only one line of every file is in memory, the shorter files are padded with empty fields.
+        """
+        files = []
+        headers = []
+        try:
+            for name in names:
+                if not os.path.exists(name):
+                    continue
+                f = open(name, newline='')
+                header = f.readline().rstrip('\r\n')
+                # skip the files without a title
+                if not header:
+                    f.close()
+                    continue
+                files.append(f)
+                headers.append(header)
+            if not files:
+                return
+            # a missing line is as many empty fields as the title has columns
+            pads = [',' * (len(next(csv.reader([header]))) - 1) for header in headers]
+            output.write(','.join(headers) + '\r\n')
+            for lines in zip_longest(*files):
+                output.write(','.join(pad if line is None else line.rstrip('\r\n')
+                                      for line, pad in zip(lines, pads)) + '\r\n')
+        finally:
+            for f in files:
+                f.close()
+
     def txtMerger(self, file_name, sequence_length, channel_num):
         # channel_num is the total number of reading channel + 1 X channel
         # we get the channel number from y_show + 1
@@ -68,28 +181,31 @@ class TxtFunction(QObject):
                     title.append('<CHA>')
                 else:
                     title.append(f'S{j+1}C{k}')
-        # creat a empty list name temp_txt to append every sub txt file
-        temp_txt = []
-        for i in range(sequence_length):
-            if os.path.exists(f'./data/{i}.csv'):
-                temp_txt.append(pd.read_csv(f'./data/{i}.csv'))
-        # open the file and writre the units
         # Example: For two read channels result, we will have the units_list as ["", "y1", "y2", "", "y1", "y2", ... ] 
         # Add the unit of x axis (empty unit) to the units lists from read channels and multiple the units_list sequence_length
         units_list = ([""] + self.units) * sequence_length
+        # the full groups are merged during the run, only the last sequences are left.
+        # a missing group would shift every later column, so a failed merge writes nothing
+        self.waitMerges()
+        parts = [f'./data/merge_{n}.csv' for n in range(self.merged_groups)]
+        parts += [f'./data/{i}.csv' for i in range(self.merged_groups * self.MERGE_GROUP, sequence_length)]
         output_name = f'{file_name}.csv'
-        # open the file and write the title and units
-        with open(output_name, 'w', newline='') as header_csv:
-            writer = csv.writer(header_csv)
+        # open the file and write the title and units, then stream the parts side by side
+        with open(output_name, 'w', newline='') as merged_csv:
+            writer = csv.writer(merged_csv)
             writer.writerow(title)
             writer.writerow(units_list)
-        # form the final dataframe from temp_txt
-        if temp_txt:
-            final_df = pd.concat(temp_txt, axis=1)
-            # write the dataframe to the same txt file
-            final_df.to_csv(output_name, header=True, index=False, mode='a')
+            self.txtSideBySide(parts, merged_csv)
 
     def txtDeleter(self):
+        self.txtClose()
+        try:
+            self.waitMerges()
+        except Exception:
+            # the files of the last run are deleted anyway
+            logging.exception('merge error')
+        self.merged_groups = 0
+        # the sequences and the merged groups
         txt_files = glob.glob('./data/*[0-9].csv')
         for file in txt_files:
             os.remove(file)